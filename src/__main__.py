@@ -1,10 +1,19 @@
+import csv
+import json
 import logging
+import sys
+from typing import Dict, List, Optional, Tuple
 
 import click
+import numpy as np
 
-from .recipe import RecipeSolver
+from .recipe import Backend, RecipeSolver
 from .needs import dog, scale
-from .food import Food
+from .food import USDA_CATALOG_PATH, Food
+from .search import search_combinations
+from .report import print_sensitivity
+from .diagnose import diagnose
+from .plan import MealPlanner
 
 logging.basicConfig(
     format="[%(asctime)s %(name)s %(levelname)s] %(message)s",
@@ -18,77 +27,551 @@ def main():
     pass
 
 
-@main.command()
-@click.option("-d", "--day", required=False, type=int, default="1")
-@click.option("--detail", required=False, type=bool, default=False)
-def opt(day: int, detail: bool):
-    foods_hard = [
-        # (Food.BAICAI, 200),
-        # (Food.BANANA, 50),
-        # (Food.BEEF, 400),
-        # (Food.BASA_FISH, 484),
-        # (Food.BEEN_SPROUT, 497),
-        # (Food.BELL_PEPER, 18),
-        # (Food.BOCAI, 270),
-        # (Food.BOKCHOY, 60),
-        # (Food.BROCCOLI, 443),
-        # (Food.CABBAGE, 458),
-        # (Food.CARROT, 461),
-        # (Food.CELERY, 662),
-        (Food.CHICKEN_BREAST, 442),
-        # (Food.CHICKEN_HEART, 37),
-        # (Food.CHICKEN_THIGH, 60),
-        # (Food.CHINESE_LETTUS, 50),
-        # (Food.CUCUMBER, 38),
-        (Food.EGG, 100),
-        # (Food.EGGPLANT, 451),
-        # (Food.LUOBO, 868),
-        (Food.JIANGDOU, 385),
-        # (Food.WHITE_MUSHROOM, 148),
-        # (Food.WINTER_MELON, 415),
-        # (Food.OYSTER, 50),
-        # (Food.PORK, 460),
-        # (Food.PORK_FAT, 50),
-        # (Food.PORK_HEART, 75),
-        # (Food.PORK_INTESTINE, 50),
-        # (Food.PORK_LIVER, 504),
-        # (Food.PORK_TONGUE, 50),
-        # (Food.POTATO, 572),
-        # (Food.PUMPKIN, 504),
-        # (Food.SIGUA, 650),
-        # (Food.SHANYAO, 600),
-        # (Food.SOYBEAN_GREEN, 80),
-        # (Food.SWEET_POTATO, 153),
-        # (Food.TOFU_FIRM, 690),
-        (Food.TOMATO, 347),
-        # (Food.ZUCCHINI, 360),
-        #
-    ]
-    foods_opts =[
+# Every food we cook with, and how much of it goes into a batch
+POOL = [
+    (Food.BAICAI, 200),
+    (Food.BANANA, 50),
+    (Food.BEEF, 400),
+    (Food.BASA_FISH, 484),
+    (Food.BEEN_SPROUT, 497),
+    (Food.BELL_PEPER, 18),
+    (Food.BOCAI, 270),
+    (Food.BOKCHOY, 60),
+    (Food.BROCCOLI, 443),
+    (Food.CABBAGE, 458),
+    (Food.CARROT, 461),
+    (Food.CELERY, 662),
+    (Food.CHICKEN_BREAST, 442),
+    (Food.CHICKEN_HEART, 37),
+    (Food.CHICKEN_THIGH, 60),
+    (Food.CHINESE_LETTUS, 50),
+    (Food.CUCUMBER, 38),
+    (Food.EGG, 100),
+    (Food.EGGPLANT, 451),
+    (Food.LUOBO, 868),
+    (Food.JIANGDOU, 385),
+    (Food.WHITE_MUSHROOM, 148),
+    (Food.WINTER_MELON, 415),
+    (Food.OYSTER, 50),
+    (Food.PORK, 460),
+    (Food.PORK_FAT, 50),
+    (Food.PORK_HEART, 75),
+    (Food.PORK_INTESTINE, 50),
+    (Food.PORK_LIVER, 504),
+    (Food.PORK_TONGUE, 50),
+    (Food.POTATO, 572),
+    (Food.PUMPKIN, 504),
+    (Food.SIGUA, 650),
+    (Food.SHANYAO, 600),
+    (Food.SOYBEAN_GREEN, 80),
+    (Food.SWEET_POTATO, 153),
+    (Food.TOFU_FIRM, 690),
+    (Food.TOMATO, 347),
+    (Food.ZUCCHINI, 360),
+]
+
+
+# The foods of POOL that opt and sweep use, at a fixed amount
+CHOSEN = {Food.CHICKEN_BREAST, Food.EGG, Food.JIANGDOU, Food.TOMATO}
+FOODS_HARD = [(food, amount) for food, amount in POOL if food in CHOSEN]
+
+
+def foods_opts(day: int) -> List[Tuple[Food, float]]:
+    return [
         (Food.RICE, 1000 * day),
         (Food.CANOLA_OIL, 5 * day),
         (Food.SALT, 2 * day),
         (Food.EGG_SHELL_POWDER, 2 * day),
         # (Food.BARF, 4 * day),
     ]
+
+
+def parse_days(day: str) -> List[int]:
+    # "7" or an inclusive range "1..30"
+    first, _, last = day.partition("..")
+    try:
+        days = list(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise click.BadParameter(f"{day!r} is not a number of days or a range like 1..30", param_hint="'-d'")
+    if not days:
+        raise click.BadParameter(f"{day!r} is an empty range, the last day comes first", param_hint="'-d'")
+    if days[0] < 1:
+        raise click.BadParameter(f"{day!r} starts below 1 day", param_hint="'-d'")
+    return days
+
+
+@main.command()
+@click.option("-d", "--day", required=False, type=str, default="1", help="Days, or a range of days like 1..30")
+@click.option("--detail", required=False, type=bool, default=False)
+@click.option("--sparse", is_flag=True, help="Keep food bounds as a box, for large catalogs")
+@click.option("--discrete", is_flag=True, help="Use whole units of the foods in UNITS")
+@click.option(
+    "--backend",
+    type=click.Choice([b.name.lower() for b in Backend]),
+    default="auto",
+    help="QP solver, auto picks by problem size",
+)
+@click.option("--format", "fmt", type=click.Choice(["text", "json", "csv"]), default="text")
+@click.option("--sensitivity", is_flag=True, help="Show the slack and shadow price of every bound")
+@click.option("--usage-weight", type=float, default=0.1, help="Weight of the optional foods against the soft needs")
+def opt(
+    day: str,
+    detail: bool,
+    sparse: bool,
+    discrete: bool,
+    backend: str,
+    fmt: str,
+    sensitivity: bool,
+    usage_weight: float,
+):
+    days = parse_days(day)
+    writer = csv.writer(sys.stdout)
+    # Above the first day found, the ones before may have none
+    header_written = False
+    p = RecipeSolver(
+        sparse=sparse,
+        day=days[0],
+        discrete=discrete,
+        backend=Backend[backend.upper()],
+        usage_weight=usage_weight,
+    )
+
+    for i, n in enumerate(days):
+        needs = dog(age=2, weight=7, active=False)
+        needs = scale(needs, n)
+
+        if i == 0:
+            for food, ub in FOODS_HARD:
+                p.add_food(food, ub, ub)
+            for food, ub in foods_opts(n):
+                p.add_food(food, 0, ub, True)
+            for nut, need in needs.items():
+                p.add_need(nut, *need)
+            optimal = p.solve()
+        else:
+            # Same foods and needs over another number of days, warm started
+            # from the previous one
+            p.update_day(n)
+            for food, ub in FOODS_HARD:
+                p.update_food_limits(food, ub, ub)
+            for food, ub in foods_opts(n):
+                p.update_food_limits(food, 0, ub)
+            for nut, need in needs.items():
+                p.update_need(nut, *need)
+            optimal = p.resolve()
+
+        if fmt == "json":
+            # One line per day
+            if optimal:
+                report = p.report(needs, n).to_dict()
+                if sensitivity:
+                    report["sensitivity"] = [r.to_dict() for r in p.sensitivity()]
+            else:
+                report = {"status": p.sol["status"], "day": n}
+                diagnosis = diagnose(p)
+                if diagnosis is not None:
+                    report.update(diagnosis.to_dict())
+            print(json.dumps(report))
+        elif fmt == "csv":
+            if not optimal:
+                click.echo(f"Day {n}: solution not found", err=True)
+                continue
+            report = p.report(needs, n)
+            if not header_written:
+                writer.writerow(report.csv_header())
+                header_written = True
+            writer.writerows(report.csv_rows())
+        else:
+            if len(days) > 1:
+                print(f"Day {n}:")
+            if optimal:
+                p.print_foods()
+                p.print_nutrition(needs, n, detail)
+                if sensitivity:
+                    print_sensitivity(p.sensitivity())
+            else:
+                print("Solution not found")
+                diagnosis = diagnose(p)
+                if diagnosis is not None:
+                    diagnosis.print()
+
+
+@main.command()
+@click.option("-d", "--day", required=False, type=int, default=1)
+@click.option("-n", "--points", required=False, type=int, default=20)
+@click.option("--min", "lo", required=False, type=float, default=1e-3, help="Smallest usage weight")
+@click.option("--max", "hi", required=False, type=float, default=1e4, help="Largest usage weight")
+def sweep(day: int, points: int, lo: float, hi: float):
+    needs = scale(dog(age=2, weight=7, active=False), day)
+
+    p = RecipeSolver(day=day)
+    for food, ub in FOODS_HARD:
+        p.add_food(food, ub, ub)
+    for food, ub in foods_opts(day):
+        p.add_food(food, 0, ub, True)
+    for nut, need in needs.items():
+        p.add_need(nut, *need)
+
+    # Only the objective depends on the weight, so does feasibility not
+    weights = np.geomspace(lo, hi, points)
+    p.update_usage_weight(weights[0])
+    if not p.solve():
+        print("Solution not found")
+        diagnosis = diagnose(p)
+        if diagnosis is not None:
+            diagnosis.print()
+        return
+
+    opts = [food for food, _ in foods_opts(day)]
+    cols = [p.food_names.index(food) for food in opts]
+    width = [max(8, len(f.name)) for f in opts]
+    print(f"{'weight':>9} {'soft':>10} {'usage':>8}  " + " ".join(f"{f.name:>{w}}" for f, w in zip(opts, width)))
+    for point in p.sweep(weights):
+        if point.amounts is None:
+            print(f"{point.usage_weight:9.3g} {point.status}")
+            continue
+        amounts = " ".join(f"{a:{w}.1f}" for a, w in zip(point.amounts[cols], width))
+        print(f"{point.usage_weight:9.3g} {point.soft:10.4f} {point.usage:8.1f}  {amounts}")
+
+
+@main.command()
+@click.option("-k", "--size", required=False, type=int, default=3, help="How many foods of POOL to combine")
+@click.option("-n", "--top", required=False, type=int, default=10)
+@click.option("-d", "--day", required=False, type=int, default=1)
+@click.option("-w", "--workers", required=False, type=int, default=None)
+def search(size: int, top: int, day: int, workers: Optional[int]):
     needs = dog(age=2, weight=7, active=False)
     needs = scale(needs, day)
 
-    p = RecipeSolver()
+    p = RecipeSolver(day=day)
+    for food, ub in foods_opts(day):
+        p.add_food(food, 0, ub, True)
+    for nut, need in needs.items():
+        p.add_need(nut, *need)
+
+    candidates = [(food, amount, amount) for food, amount in POOL]
+    for c in search_combinations(p, candidates, size, top, workers):
+        hard = ", ".join(f"{f.name} {c.amounts[f]:g}" for f in c.foods)
+        opts = ", ".join(f"{f.name} {c.amounts[f]:.1f}" for f, _ in foods_opts(day))
+        print(f"{c.objective:10.4f}  {hard} | {opts}")
 
-    for food, ub in foods_hard:
-        p.add_food(food, ub, ub)
-    for food, ub in foods_opts:
+
+@main.command()
+@click.option("-d", "--day", required=False, type=int, default=7)
+@click.option(
+    "--variety", required=False, type=int, default=0, help="Serve each food of POOL at most once in this many days"
+)
+def plan(day: int, variety: int):
+    needs = dog(age=2, weight=7, active=False)
+
+    p = MealPlanner(day)
+    for food, amount in POOL:
+        p.add_food(food, 0, amount)
+    for food, ub in foods_opts(1):
         p.add_food(food, 0, ub, True)
     for nut, need in needs.items():
         p.add_need(nut, *need)
-    optimal = p.solve()
+    if variety > 1:
+        for food, amount in POOL:
+            p.add_variety(food, variety, amount)
 
-    if optimal:
+    if p.solve():
+        p.print_plan()
+    else:
+        print("Solution not found")
+
+
+@main.command()
+@click.argument("dogs", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-p",
+    "--pantry",
+    required=False,
+    type=click.Path(exists=True, dir_okay=False),
+    help="CSV of food,grams rows, optionally under a food,grams header: the id, name or source of a food and "
+    "how many grams of it there are",
+)
+@click.option("-d", "--day", required=False, type=int, default=1, help="Days the pantry has to last")
+def kennel(dogs: str, pantry: Optional[str], day: int):
+    # A day's recipe for every dog of DOGS, a CSV of name,age,weight,active,
+    # from the foods of POOL and the pantry without using more than it has
+    from .kennel import Kennel
+    from .registry import registry
+
+    with open(dogs, newline="") as f:
+        rows = list(csv.DictReader(f))
+    profiles = [
+        dog(age=float(r["age"]), weight=float(r["weight"]), active=r["active"].strip().lower() in ("1", "true", "yes"))
+        for r in rows
+    ]
+    p = Kennel(profiles, [r["name"] for r in rows])
+
+    stock = []
+    if pantry is not None:
+        with open(pantry, newline="") as f:
+            for i, r in enumerate(csv.DictReader(f, fieldnames=["food", "grams"])):
+                key, grams = r["food"].strip(), r["grams"]
+                if grams is None:
+                    raise click.ClickException(f"No grams of {key!r} in {pantry}")
+                if i == 0 and key == "food" and grams.strip() == "grams":
+                    continue
+                food = registry.get(int(key) if key.isdigit() else key)
+                if food is None:
+                    raise click.ClickException(f"No food {key!r}, see find")
+                stock.append((food, float(grams) / day))
+    # Each dog gets at most a batch of a food of POOL, or what there is
+    opts = dict(foods_opts(1))
+    limits = {**dict(POOL), **opts}
+    for food, amount in stock:
+        limits[food] = min(limits.get(food, amount), amount)
+    for food, amount in limits.items():
+        p.add_food(food, 0, amount, food in opts)
+    for food, amount in stock:
+        p.add_stock(food, amount)
+
+    # The QP would run out of iterations first
+    if not p.feasible():
+        print("Solution not found, the pantry can not meet the hard needs of every dog")
+    elif p.solve():
+        p.print_plan()
+    else:
+        print("Solution not found")
+
+
+@main.command(name="prefetch")
+@click.option("-w", "--workers", required=False, type=int, default=8)
+@click.option("--refresh", is_flag=True, help="Revalidate every food with its server and parse it again")
+@click.option("--reparse", is_flag=True, help="Parse every food again from the stored responses, offline")
+def prefetch_foods(workers: int, refresh: bool, reparse: bool):
+    # Fills foods/*.json for every food of GETTERS, then the catalog
+    from .find import segments
+    from .food import build_catalog, prefetch
+    from .food_getters import http
+
+    if refresh:
+        http.mode = http.Mode.REFRESH
+    elif reparse:
+        http.mode = http.Mode.OFFLINE
+    errors = prefetch(workers=workers, every=refresh or reparse)
+    for food, e in errors.items():
+        print(f"  {food.name}: {e!r}")
+    catalog = build_catalog()
+    print(f"{len(catalog)} foods in the catalog, {len(errors)} failed")
+    segments()  # Indexes the new descriptions for find
+    if errors:
+        sys.exit(1)
+
+
+@main.command(name="import-fdc")
+@click.argument("src", type=click.Path(exists=True, dir_okay=False))
+@click.option("-o", "--output", required=False, type=str, default=str(USDA_CATALOG_PATH))
+@click.option("--restart", is_flag=True, help="Import from the start, not from the last checkpoint")
+def import_fdc_file(src: str, output: str, restart: bool):
+    # A FoodData Central bulk JSON download into a catalog for solve
+    from pathlib import Path
+
+    from .find import segments
+    from .food_getters.fdc import import_fdc
+    from .registry import Registry
+
+    result = import_fdc(Path(src), Path(output), resume=not restart)
+    segments(Registry([Path(output)]))
+    print(f"{result.foods} foods in {output}, {result.skipped} without nutrients we track")
+    if result.resumed:
+        print(f"  Resumed at {result.resumed} foods of an earlier run")
+    if result.unknown:
+        names = ", ".join(name for name, _ in result.unknown.most_common(10))
+        print(f"  Nutrients not in NAME_TO_ENUM: {names}")
+
+
+@main.command()
+@click.option(
+    "-f",
+    "--food",
+    "foods",
+    type=(str, float, float),
+    multiple=True,
+    required=True,
+    help="Id, name or source of a food, like usda:748967, and its least and most grams",
+)
+@click.option("-d", "--day", required=False, type=int, default=1)
+@click.option("--catalog", "catalogs", multiple=True, type=str, help="Only these catalogs, all of foods/ by default")
+@click.option("--usage-weight", type=float, default=0.1, help="Weight of the optional foods against the soft needs")
+def solve(foods: Tuple[Tuple[str, float, float], ...], day: int, catalogs: Tuple[str, ...], usage_weight: float):
+    # Like opt, with any foods of the registry instead of FOODS_HARD, those
+    # of the imported catalogs are never fetched
+    from pathlib import Path
+
+    from .registry import Registry, registry
+
+    if catalogs:
+        registry = Registry([Path(c) for c in catalogs])
+    p = RecipeSolver(day=day, usage_weight=usage_weight)
+    for key, lb, ub in foods:
+        food = registry.get(int(key) if key.isdigit() else key)
+        if food is None:
+            raise click.ClickException(f"No food {key!r}, see import-fdc")
+        p.add_food(food, lb, ub)
+    for food, ub in foods_opts(day):
+        p.add_food(food, 0, ub, True)
+    needs = scale(dog(age=2, weight=7, active=False), day)
+    for nut, need in needs.items():
+        p.add_need(nut, *need)
+
+    if p.solve():
         p.print_foods()
-        p.print_nutrition(needs, day, detail)
+        p.print_nutrition(needs, day, False)
     else:
         print("Solution not found")
+        diagnosis = diagnose(p)
+        if diagnosis is not None:
+            diagnosis.print()
+
+
+@main.command(name="find")
+@click.argument("query", nargs=-1, required=True)
+@click.option("-n", "--top", required=False, type=int, default=10)
+def find_foods(query: Tuple[str, ...], top: int):
+    # Foods by their names and descriptions, with the id and key solve takes
+    from .catalog import CatalogFood
+    from .find import find
+
+    for m in find(" ".join(query), top):
+        key = m.food.source if isinstance(m.food, CatalogFood) else m.food.name
+        print(f"{m.id:>7}  {m.score:.2f}  {key:<16}  {m.description}")
+
+
+@main.command(name="substitutes")
+@click.argument("food")
+@click.option("-k", "--top", required=False, type=int, default=5)
+@click.option("--per", type=click.Choice(["gram", "energy"]), default="gram", help="Compare per 100 g or per 1000 kcal")
+@click.option("--check", is_flag=True, help="Solve opt with each substitute in place of FOOD")
+@click.option("-d", "--day", required=False, type=int, default=1)
+def find_substitutes(food: str, top: int, per: str, check: bool, day: int):
+    # The foods nearest to FOOD by nutrients, and how they differ most
+    from .catalog import CatalogFood
+    from .nutrient import NUTRIENTS
+    from .registry import registry
+    from .report import display_units
+    from .substitute import Basis, check_swaps, nutrient_index, substitutes
+
+    subject = registry.get(int(food) if food.isdigit() else food)
+    if subject is None:
+        raise click.ClickException(f"No food {food!r}, see find")
+    basis = Basis[per.upper()]
+    try:
+        subs = substitutes(subject, top, basis)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    passes = None
+    if check:
+        hard: Dict[Food | CatalogFood, float] = dict(FOODS_HARD)
+        amount = hard.get(subject)
+        if amount is None:
+            raise click.ClickException(f"{subject} is not in FOODS_HARD, there is nothing to swap")
+        p = RecipeSolver(day=day)
+        for f, ub in FOODS_HARD:
+            p.add_food(f, ub, ub)
+        for f, ub in foods_opts(day):
+            p.add_food(f, 0, ub, True)
+        for nut, need in scale(dog(age=2, weight=7, active=False), day).items():
+            p.add_need(nut, *need)
+        print(f"As it is: {'passes' if p.solve() else 'fails'}")
+        passes = check_swaps(p, subject, amount, subs, basis)
+
+    unit = "100 g" if basis == Basis.GRAM else "1000 kcal"
+    for i, s in enumerate(subs):
+        key = s.food.source if isinstance(s.food, CatalogFood) else s.food.name
+        verdict = "" if passes is None else ("  passes" if passes[i] else "  fails")
+        print(f"{s.id:>7}  {s.distance:6.2f}  {key:<16}  {s.food}{verdict}")
+        # The nutrients it differs most in, relative to their usual amounts
+        for j in np.argsort(-np.abs(s.deltas / nutrient_index(basis).scale))[:4]:
+            n = NUTRIENTS[j]
+            scales, units = display_units([n], np.abs(s.deltas[j : j + 1]))
+            print(f"           {s.deltas[j] / scales[0]:+10.3g} {units[0]:<3} {n.name} per {unit}")
+
+
+@main.command(name="bench-parse")
+@click.option("-r", "--repeat", required=False, type=click.IntRange(1), default=3, help="Best of this many runs")
+@click.argument("paths", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+def bench_parse(repeat: int, paths: Tuple[str, ...]):
+    # Both chinanutri parsers over saved pages, the stored responses by default
+    from .food_getters import chinanutri, http
+
+    if paths:
+        names = list(paths)
+        pages = [open(p, encoding="utf-8").read() for p in paths]
+    else:
+        responses = list(http.stored(f"{chinanutri.BASE_URL}/fq/foodinfo/"))
+        names = [r.url for r in responses]
+        pages = [r.text for r in responses]
+    if not pages:
+        print("No pages")
+        return
+
+    result = chinanutri.bench_parse(pages, repeat)
+    print(f"{result.pages} pages")
+    print(f"  parse_page       {result.fast:10.1f} pages/s")
+    print(f"  parse_page_soup  {result.soup:10.1f} pages/s")
+    if result.mismatches:
+        print(f"Different results on {len(result.mismatches)} pages, e.g. {names[result.mismatches[0]]}")
+        sys.exit(1)
+
+
+@main.command(name="check-fetch")
+def check_fetch():
+    # get() against a local stub server, see food_getters.stub
+    from .food_getters.stub import check_fetch
+
+    results = check_fetch()
+    for r in results:
+        print(f"{'ok' if r.ok else 'FAILED':6}  {r.name}: {r.detail}")
+    if not all(r.ok for r in results):
+        sys.exit(1)
+
+
+@main.command(name="check-batch")
+@click.option("-w", "--workers", required=False, type=int, default=2)
+def check_batch(workers: int):
+    # solve_many over the foods of opt with an infeasible profile between two
+    # feasible ones, a dog with one day of needs for three days of food. It
+    # has to come back without x, and not cost the others their solution.
+    day = 3
+    needs = scale(dog(age=2, weight=7, active=False), day)
+    profiles = [needs, scale(dog(age=2, weight=7, active=False), 1), needs]
+    expected = [True, False, True]
+
+    failed = False
+    for backend, discrete in [("active_set", False), ("cvxopt", False), ("auto", True)]:
+        p = RecipeSolver(day=day, backend=Backend[backend.upper()], discrete=discrete)
+        for food, ub in FOODS_HARD:
+            p.add_food(food, ub, ub)
+        for food, ub in foods_opts(day):
+            p.add_food(food, 0, ub, True)
+        for w in sorted({1, workers}):
+            results = list(p.solve_many(profiles, w))
+            ok = all(
+                r.error is None and (r.status == "optimal" and r.x is not None) == feasible
+                for r, feasible in zip(results, expected)
+            )
+            failed |= not ok
+            name = f"{backend}{' discrete' if discrete else ''}, {w} workers"
+            print(f"{name:30} {', '.join(r.status for r in results)}{'' if ok else '  FAILED'}")
+    if failed:
+        sys.exit(1)
+
+
+@main.command()
+@click.option("--budget", required=False, type=float, default=None, help="In ms of import time")
+@click.option("--runs", required=False, type=int, default=5)
+@click.argument("args", nargs=-1)
+def importtime(budget: Optional[float], runs: int, args: Tuple[str, ...]):
+    # Checks the imports of another command, opt by default
+    from .startup import BUDGET_MS, check
+
+    if not check(list(args) or ["opt"], BUDGET_MS if budget is None else budget, runs):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,227 @@
+from typing import List, Optional, Tuple
+
+import cvxopt
+import numpy as np
+
+# Goldfarb, Idnani. A numerically stable dual method for solving strictly
+# convex quadratic programs. Mathematical Programming 27, 1983.
+#
+# Solves the recipe QP
+#
+#     minimize    1/2 x^T P x + q^T x
+#     subject to  lb <= x <= ub,  R x <= r
+#
+# with the dual active set method: start from the unconstrained minimum and
+# add the most violated constraint until none is left, dropping the ones
+# whose multiplier would turn negative. Every iteration is a dense O(n^3)
+# solve, which for a dozen or so foods is cheaper than an interior point
+# solve and detects infeasible problems right away. The result is shaped like the one of
+# cvxopt.solvers.qp, with z the multipliers of G = [-I; I; R].
+#
+# active, rows of G, warm starts the method from the minimum over those rows
+# held with equality, e.g. the support of z of a nearby problem. When the
+# nearby problem is close, only a step or two is left.
+
+# Foods are scaled by their upper bound and P is regularized by REGULARIZE
+# times its largest diagonal entry, the method needs P strictly convex.
+# When P is singular, e.g. two foods with proportional nutrients and no
+# usage weight, the optimum is not unique: the regularized problem picks
+# the plan of least scaled amounts, cvxopt one inside the optimal face.
+# Their objectives agree, their amounts need not.
+REGULARIZE = 1e-9
+TOLERANCE = 1e-9
+
+
+def active_set_qp(
+    P: np.ndarray,
+    q: np.ndarray,
+    lb: np.ndarray,
+    ub: np.ndarray,
+    R: np.ndarray,
+    r: np.ndarray,
+    active: Optional[np.ndarray] = None,
+) -> dict:
+    n = len(q)
+    # Foods with lb == ub are substituted, their bounds would be dependent
+    fixed = ub - lb <= 1e-12 * np.maximum(1, np.abs(ub))
+    free = ~fixed
+    x = np.where(fixed, lb, 0.0)
+
+    scale = np.where(np.isfinite(ub[free]) & (ub[free] > 0), ub[free], 1.0)
+    Py = P[np.ix_(free, free)] * scale[:, None] * scale[None, :]
+    qy = (q[free] + P[np.ix_(free, fixed)] @ x[fixed]) * scale
+    m = len(qy)
+    # Constraints C y >= b
+    C = np.vstack([np.eye(m), -np.eye(m), -R[:, free] * scale])
+    b = np.concatenate([lb[free] / scale, -ub[free] / scale, R[:, fixed] @ x[fixed] - r])
+
+    pmax = max(Py.diagonal().max(initial=0), 1e-12)
+    Py[np.diag_indices(m)] += REGULARIZE * pmax
+    start = None
+    if active is not None:
+        # Rows of G to rows of C, skipping the fixed foods
+        index = np.full(2 * n + len(R), -1)
+        index[np.flatnonzero(free)] = np.arange(m)
+        index[n + np.flatnonzero(free)] = np.arange(m, 2 * m)
+        index[2 * n :] = np.arange(2 * m, 2 * m + len(R))
+        start = _start(Py, qy, C, b, [int(i) for i in index[active] if i >= 0], m)
+    # Rows of C in the active set, and their multipliers u
+    working: List[int]
+    if start is None:
+        y, working, u = -np.linalg.solve(Py, qy), [], np.zeros(0)
+    else:
+        y, working, u = start
+
+    status = "unknown"
+    iterations = 0
+    while iterations < 10 * (len(C) + 1):
+        iterations += 1
+        slack = C @ y - b
+        slack[working] = np.inf
+        p = int(np.argmin(slack)) if len(slack) else 0
+        if not len(slack) or slack[p] >= -TOLERANCE:
+            status = "optimal"
+            break
+
+        a = C[p]
+        u = np.append(u, 0.0)
+        while True:
+            step, dual = _step(Py, C, working, a, m)
+            k = len(working)
+
+            # Partial step, the largest one keeping the multipliers >= 0
+            t1, drop = np.inf, -1
+            positive = np.flatnonzero(dual > 1e-12)
+            if len(positive):
+                ratios = u[positive] / dual[positive]
+                drop = positive[np.argmin(ratios)]
+                t1 = ratios.min()
+            # Full step, to satisfy constraint p. a is a combination of the
+            # active constraints when the step has no curvature
+            curvature = step @ a
+            dependent = curvature <= 1e-12 * (a @ a) / pmax
+            t2 = np.inf if dependent else (b[p] - a @ y) / curvature
+            t = min(t1, t2)
+            if t == np.inf:
+                status = "primal infeasible"
+                break
+
+            u[:k] -= t * dual
+            u[k] += t
+            if not dependent:
+                y += t * step
+            if t == t2:
+                working.append(p)
+                break
+            del working[drop]
+            u = np.delete(u, drop)
+
+        if status != "unknown":
+            break
+
+    if status != "optimal":
+        return {"status": status, "x": None, "z": None, "s": None, "iterations": iterations}
+
+    x[free] = y * scale
+    mult = np.zeros(len(C))
+    mult[working] = u
+    z = np.zeros(2 * n + len(R))
+    z[np.flatnonzero(free)] = mult[:m] / scale
+    z[n + np.flatnonzero(free)] = mult[m : 2 * m] / scale
+    z[2 * n :] = mult[2 * m :]
+    # The fixed foods take whatever is left of the gradient
+    grad = P @ x + q + R.T @ z[2 * n :]
+    fixed = np.flatnonzero(fixed)
+    z[fixed] = np.maximum(grad[fixed], 0)
+    z[n + fixed] = np.maximum(-grad[fixed], 0)
+
+    s = np.concatenate([x - lb, ub - x, r - R @ x])
+    return {
+        "status": status,
+        "x": cvxopt.matrix(x),
+        "z": cvxopt.matrix(z),
+        "s": cvxopt.matrix(np.maximum(s, 0)),
+        "primal objective": 0.5 * x @ P @ x + q @ x,
+        "iterations": iterations,
+    }
+
+
+# The step of the dual method for adding constraint a, with
+#
+#     P step + N dual = a,    N^T step = 0
+#
+# for the columns N of the active constraints. Active bounds fix their
+# food, so this is only solved over the other foods and the active rows.
+def _step(P: np.ndarray, C: np.ndarray, active: List[int], a: np.ndarray, m: int):
+    rows = np.array(active, dtype=np.intp)
+    bounds = rows < 2 * m
+    var = rows[bounds] % m
+    sign = np.where(rows[bounds] < m, 1.0, -1.0)
+    free = np.ones(m, dtype=bool)
+    free[var] = False
+    N = C[rows[~bounds]][:, free].T
+
+    f, g = np.count_nonzero(free), len(N.T)
+    K = np.zeros((f + g, f + g))
+    K[:f, :f] = P[free][:, free]
+    K[:f, f:] = N
+    K[f:, :f] = N.T
+    rhs = np.concatenate([a[free], np.zeros(g)])
+    try:
+        sol = np.linalg.solve(K, rhs)
+    except np.linalg.LinAlgError:
+        sol = np.linalg.lstsq(K, rhs, rcond=None)[0]
+
+    step = np.zeros(m)
+    step[free] = sol[:f]
+    dual = np.empty(len(rows))
+    dual[~bounds] = sol[f:]
+    rest = a - P @ step - C[rows[~bounds]].T @ sol[f:]
+    dual[bounds] = sign * rest[var]
+    return step, dual
+
+
+# The minimum of the QP over the rows active held with equality, as a start
+# of the dual method: constraints whose multiplier is negative are dropped
+# until all are >= 0. None when the rows are dependent.
+def _start(
+    P: np.ndarray, q: np.ndarray, C: np.ndarray, b: np.ndarray, active: List[int], m: int
+) -> Optional[Tuple[np.ndarray, List[int], np.ndarray]]:
+    # Both bounds of a food can not be active, keep the lower one
+    lower = {i for i in active if i < m}
+    active = [i for i in active if not (m <= i < 2 * m and i - m in lower)]
+    while True:
+        rows = np.array(active, dtype=np.intp)
+        bounds = rows < 2 * m
+        var = rows[bounds] % m
+        sign = np.where(rows[bounds] < m, 1.0, -1.0)
+        free = np.ones(m, dtype=bool)
+        free[var] = False
+        y = np.zeros(m)
+        y[var] = sign * b[rows[bounds]]
+
+        # P_FF y_F - N u = -q_F - P_FB y_B,  N^T y_F = b_G - C_GB y_B
+        CG = C[rows[~bounds]]
+        N = CG[:, free].T
+        f, g = np.count_nonzero(free), len(CG)
+        if g and np.linalg.matrix_rank(N) < g:
+            return None
+        K = np.zeros((f + g, f + g))
+        K[:f, :f] = P[free][:, free]
+        K[:f, f:] = -N
+        K[f:, :f] = N.T
+        rhs = np.concatenate([-q[free] - P[free] @ y, b[rows[~bounds]] - CG @ y])
+        try:
+            sol = np.linalg.solve(K, rhs)
+        except np.linalg.LinAlgError:
+            return None
+        y[free] = sol[:f]
+
+        u = np.empty(len(rows))
+        u[~bounds] = sol[f:]
+        grad = P @ y + q - CG.T @ sol[f:]
+        u[bounds] = sign * grad[var]
+        negative = u < -TOLERANCE
+        if not negative.any():
+            return y, active, np.maximum(u, 0)
+        active = [i for i, neg in zip(active, negative) if not neg]
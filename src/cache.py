@@ -0,0 +1,143 @@
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import cvxopt
+import numpy as np
+
+# Per user, not per working directory, so every run shares the solutions,
+# the stored responses of food_getters.http and the index of find
+CACHE_ROOT = Path(
+    os.environ.get("FOOD_SOLVER_CACHE")
+    or Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "food_solver"
+)
+CACHE_DIR = CACHE_ROOT / "solutions"
+CACHE_SIZE = 128
+CACHE_DISK_BYTES = 64 * 2**20
+
+
+# Solutions keyed by the content hash of their problem, see
+# RecipeSolver._key. The key covers the nutrient vectors of the foods, so a
+# changed foods/*.json entry is a different key and never hits a stale
+# solution, the old one just ages out.
+#
+# Recent solutions are kept in memory, and written to directory as one .npz
+# file each. When the directory grows past disk_bytes, the least recently
+# used files are removed.
+class SolutionCache:
+    hits: int
+    disk_hits: int
+    misses: int
+
+    def __init__(
+        self,
+        directory: Optional[Path] = CACHE_DIR,
+        size: int = CACHE_SIZE,
+        disk_bytes: int = CACHE_DISK_BYTES,
+    ) -> None:
+        self.directory = directory
+        self.size = size
+        self.disk_bytes = disk_bytes
+        self.memory: OrderedDict[bytes, dict] = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # Bytes in directory, counted on the first store
+        self.disk_used: Optional[int] = None
+
+    def get(self, key: bytes) -> Optional[dict]:
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+
+        sol = self._load(key)
+        if sol is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, sol)
+        return sol
+
+    # Solutions of one-off problems, like the nodes of a search, are only
+    # kept in memory with persist=False
+    def put(self, key: bytes, sol: dict, persist: bool = True):
+        self._remember(key, sol)
+        if persist and self.directory is not None:
+            self._store(key, sol)
+
+    def clear(self):
+        self.memory.clear()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.directory is not None and self.directory.exists():
+            for path in self.directory.glob("*.npz"):
+                path.unlink(missing_ok=True)
+        self.disk_used = None
+
+    def __repr__(self) -> str:
+        return f"SolutionCache(hits={self.hits}, disk_hits={self.disk_hits}, misses={self.misses})"
+
+    def _remember(self, key: bytes, sol: dict):
+        self.memory[key] = sol
+        if len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def _path(self, key: bytes) -> Path:
+        assert self.directory is not None
+        return self.directory / f"{key.hex()}.npz"
+
+    def _load(self, key: bytes) -> Optional[dict]:
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as f:
+                arrays = dict(f)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        # Mark as recently used for eviction
+        os.utime(path)
+
+        sol = {k: None for k in arrays.pop("__none__").tolist()}
+        for k, v in arrays.items():
+            sol[k] = cvxopt.matrix(v) if v.ndim == 2 else v.item()
+        return sol
+
+    def _store(self, key: bytes, sol: dict):
+        arrays: Dict[str, Any] = {"__none__": np.array([k for k, v in sol.items() if v is None], dtype=str)}
+        for k, v in sol.items():
+            if isinstance(v, cvxopt.matrix):
+                arrays[k] = np.array(v)
+            elif isinstance(v, (str, int, float)):
+                arrays[k] = np.array(v)
+
+        assert self.directory is not None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+        if self.disk_used is None:
+            self.disk_used = sum(p.stat().st_size for p in self.directory.glob("*.npz"))
+        else:
+            self.disk_used += path.stat().st_size
+        if self.disk_used > self.disk_bytes:
+            self._evict(path)
+
+    def _evict(self, keep: Path):
+        assert self.directory is not None
+        files = [(p, p.stat()) for p in self.directory.glob("*.npz")]
+        self.disk_used = sum(s.st_size for _, s in files)
+        # Down to 90%, so that the next stores do not evict again right away
+        for path, stat in sorted(files, key=lambda f: f[1].st_mtime):
+            if self.disk_used <= 0.9 * self.disk_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            self.disk_used -= stat.st_size
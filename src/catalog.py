@@ -0,0 +1,156 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from .nutrient import NUTRIENTS
+
+# A compiled foods × nutrients table, so that building a solver reads one
+# memory mapped file instead of parsing a JSON file per food. foods/*.json
+# stay the source of truth, see food.build_catalog.
+#
+# The file is
+#
+#     MAGIC, u64 length of the header, header as JSON, padding to ALIGN,
+#     float64 matrix of foods × nutrients in C order
+#
+# and the header holds SCHEMA_VERSION, the nutrient names of the columns,
+# and per food its name, description, source and the mtime of its JSON file.
+# A catalog of another version or other nutrients is not opened at all.
+SCHEMA_VERSION = 1
+MAGIC = b"FOODCAT\0"
+ALIGN = 64
+CHUNK_ROWS = 4096  # Rows written at a time, the matrix may be a memmap
+
+
+# A food of a catalog other than the compiled one, e.g. of an import of
+# FoodData Central, see food_getters/fdc.py. Solvers take it like a Food.
+class CatalogFood(NamedTuple):
+    path: str
+    name: str
+    source: str
+    row: int
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class Catalog:
+    names: List[str]
+    descriptions: List[str]
+    sources: List[str]
+    mtimes: List[int]  # st_mtime_ns of the food's JSON file, 0 for none
+    index: Dict[str, int]
+    matrix: np.ndarray  # (foods, nutrients), read only and memory mapped
+
+    def __init__(self, path: Path, header: dict, matrix: np.ndarray) -> None:
+        self.path = path
+        self.names = header["foods"]
+        self.descriptions = header["descriptions"]
+        self.sources = header["sources"]
+        self.mtimes = header["mtimes"]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.by_source: Optional[Dict[str, int]] = None
+        self.matrix = matrix
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    # The row of name, None when it is missing or was compiled from another
+    # version of its JSON file than the one of mtime
+    def vector(self, name: str, mtime: Optional[int] = None) -> Optional[np.ndarray]:
+        i = self.index.get(name)
+        if i is None or (mtime is not None and self.mtimes[i] != mtime):
+            return None
+        return self.matrix[i]
+
+    # The food named key, or of the source key like "usda:748967"
+    def food(self, key: str) -> Optional[CatalogFood]:
+        i = self.index.get(key)
+        if i is None:
+            if self.by_source is None:
+                self.by_source = {source: i for i, source in enumerate(self.sources)}
+            i = self.by_source.get(key)
+        return None if i is None else self.at(i)
+
+    def at(self, row: int) -> CatalogFood:
+        return CatalogFood(str(self.path), self.names[row], self.sources[row], row)
+
+
+_catalogs: Dict[str, Catalog] = {}
+
+
+# open_catalog once per process, for the rows of CatalogFoods
+def load_catalog(path: Path) -> Optional[Catalog]:
+    key = str(path)
+    if key not in _catalogs:
+        catalog = open_catalog(path)
+        if catalog is None:
+            return None
+        _catalogs[key] = catalog
+    return _catalogs[key]
+
+
+def open_catalog(path: Path) -> Optional[Catalog]:
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            size = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            header = json.loads(f.read(size))
+    except (FileNotFoundError, ValueError, IndexError):
+        return None
+    if header.get("version") != SCHEMA_VERSION or header.get("nutrients") != [n.name for n in NUTRIENTS]:
+        return None
+
+    shape = (len(header["foods"]), len(NUTRIENTS))
+    if not shape[0]:
+        return Catalog(path, header, np.zeros(shape))
+    matrix = np.memmap(path, dtype="<f8", mode="r", offset=_data_offset(size), shape=shape)
+    # Rows are plain arrays, the map stays open as their base
+    return Catalog(path, header, matrix.view(np.ndarray))
+
+
+def write_catalog(
+    path: Path,
+    names: List[str],
+    descriptions: List[str],
+    sources: List[str],
+    mtimes: List[int],
+    matrix: np.ndarray,
+):
+    header = json.dumps(
+        {
+            "version": SCHEMA_VERSION,
+            "nutrients": [n.name for n in NUTRIENTS],
+            "foods": names,
+            "descriptions": descriptions,
+            "sources": sources,
+            "mtimes": mtimes,
+        },
+        ensure_ascii=False,
+    ).encode()
+    offset = _data_offset(len(header))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Processes may have the old file mapped, it is replaced and never
+    # written over
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array([len(header)], dtype="<u8").tobytes())
+        f.write(header)
+        f.write(b"\0" * (offset - f.tell()))
+        for i in range(0, len(matrix), CHUNK_ROWS):
+            f.write(np.ascontiguousarray(matrix[i : i + CHUNK_ROWS], dtype="<f8").tobytes())
+    os.replace(tmp, path)
+
+
+def _data_offset(header_size: int) -> int:
+    end = len(MAGIC) + 8 + header_size
+    return -(-end // ALIGN) * ALIGN
@@ -0,0 +1,154 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import cvxopt
+import numpy as np
+
+from .food import Food
+from .kkt import box_operators
+from .nutrient import Nutrient
+from .recipe import RecipeSolver
+from .report import Bound, display_units
+
+
+class Relaxation(NamedTuple):
+    subject: Food | Nutrient
+    bound: Bound
+    value: float
+    relaxed: float
+
+
+class Diagnosis(NamedTuple):
+    # An irreducible infeasible set: these bounds conflict, and dropping any
+    # one of them resolves the conflict
+    conflict: List[Tuple[Food | Nutrient, Bound, float]]
+    # The smallest relative change of bounds that makes the problem feasible
+    relaxations: List[Relaxation]
+
+    def to_dict(self) -> Dict:
+        return {
+            "conflict": [
+                {"subject": subject.name, "bound": bound.name.lower(), "value": value}
+                for subject, bound, value in self.conflict
+            ],
+            "relaxations": [
+                {"subject": r.subject.name, "bound": r.bound.name.lower(), "value": r.value, "relaxed": r.relaxed}
+                for r in self.relaxations
+            ],
+        }
+
+    def print(self):
+        print("Conflicting bounds:")
+        for subject, bound, value in self.conflict:
+            print(f"  {subject} {_op(bound)} {_amount(subject, value)}")
+        print("Smallest relaxation:")
+        for r in self.relaxations:
+            print(f"  {r.subject} {_op(r.bound)} {_amount(r.subject, r.value)} -> {_amount(r.subject, r.relaxed)}")
+
+
+def _op(bound: Bound) -> str:
+    return ">=" if bound == Bound.LOWER else "<="
+
+
+def _amount(subject: Food | Nutrient, value: float) -> str:
+    if not isinstance(subject, Nutrient):
+        return f"{value:g} g"
+    scale, unit = display_units([subject], np.array([value]))
+    return f"{value / scale[0]:g} {unit[0]}"
+
+
+# Chinneck, Dravnieks. Locating minimal infeasible constraint sets in linear
+# programs. ORSA Journal on Computing 3, 1991.
+#
+# Explains why the hard constraints G x <= h of p conflict, None if they do
+# not. The foods' lower bounds of 0 always hold and are not reported, a
+# negative amount of food is no fix.
+#
+# The conflict is found with the deletion filter: drop a row, keep it out if
+# the rest is still infeasible. Every infeasible LP also returns a Farkas
+# certificate z >= 0, G^T z = 0, h^T z < 0, and rows outside its support are
+# not needed for the conflict, so they are all dropped at once.
+def diagnose(p: RecipeSolver) -> Optional[Diagnosis]:
+    if not p.assembled:
+        p._assemble()
+    G = box_operators(p.U, p.penalty, p.R)[1]
+    h = p.h
+    subjects, kinds, scale = p._rows()
+
+    n = len(p.food_names)
+    fixed = np.flatnonzero(h[:n] == 0).tolist()
+    rows = _conflict(G, h, fixed, [r for r in range(len(h)) if r not in fixed])
+    if rows is None:
+        return None
+    i = 0
+    while i < len(rows):
+        rest = _conflict(G, h, fixed, rows[:i] + rows[i + 1 :])
+        if rest is None:
+            i += 1
+        else:
+            # Rows before i are needed by every subset of rows, they stay
+            rows = rest
+
+    conflict = [(subjects[r], kinds[r], float(abs(h[r]) * scale[r])) for r in rows]
+    return Diagnosis(conflict, _relax(G, h, p.ub, subjects, kinds, scale))
+
+
+# The support of a certificate that rows of G x <= h are infeasible, None if
+# they are feasible.
+#
+# A subset of the rows may leave foods unbounded, and cvxopt needs G to have
+# full rank. Every food is boxed to |x| <= BOX, far beyond any real amount, a
+# certificate that needs the box does not count.
+BOX = 1e9
+
+
+def _conflict(G: cvxopt.spmatrix, h: np.ndarray, fixed: List[int], rows: List[int]) -> Optional[List[int]]:
+    n = G.size[1]
+    box = cvxopt.spmatrix([-1.0] * n + [1.0] * n, range(2 * n), list(range(n)) * 2)
+    sol = cvxopt.solvers.lp(
+        cvxopt.matrix(0.0, (n, 1)),
+        cvxopt.sparse([G[rows + fixed, :], box]),
+        cvxopt.matrix(np.concatenate([h[rows + fixed], np.full(2 * n, BOX)])),
+        options={"show_progress": False},
+    )
+    if sol["status"] != "primal infeasible":
+        return None
+    z = np.array(sol["z"]).ravel()
+    support = z > 1e-8 * z.max()
+    if support[len(rows) + len(fixed) :].any():
+        return None
+    return [r for r, s in zip(rows, support) if s]
+
+
+# Phase 1 with elastic rows: minimize the weighted sum of e >= 0 subject to
+# G x - e <= h. The weights make e relative to each bound, the nutrient rows
+# are relative already.
+def _relax(G, h, ub, subjects, kinds, scale) -> List[Relaxation]:
+    n = G.size[1]
+    m = len(h)
+    # Every row but the foods' lower bounds of 0
+    elastic = np.flatnonzero(np.concatenate([h[:n] != 0, np.ones(m - n, dtype=bool)]))
+    weight = np.concatenate([1 / np.maximum(ub, 1), 1 / np.maximum(ub, 1), np.ones(m - 2 * n)])[elastic]
+
+    k = len(elastic)
+    E = cvxopt.spmatrix(-1.0, elastic, range(k), (m, k))
+    A = cvxopt.sparse([[G, cvxopt.spmatrix([], [], [], (k, n))], [E, cvxopt.spmatrix(-1.0, range(k), range(k))]])
+    sol = cvxopt.solvers.lp(
+        cvxopt.matrix(np.concatenate([np.zeros(n), weight])),
+        A,
+        cvxopt.matrix(np.concatenate([h, np.zeros(k)])),
+        options={"show_progress": False},
+    )
+    if sol["status"] != "optimal":
+        return []
+
+    e = np.array(sol["x"]).ravel()[n:]
+    ret = []
+    for j, r in enumerate(elastic):
+        if e[j] <= 1e-6 * max(abs(h[r]), 1):
+            continue
+        value = abs(h[r]) * scale[r]
+        # Rows are G x <= h, a lower bound's h is its negation
+        delta = e[j] * scale[r]
+        relaxed = value - delta if kinds[r] == Bound.LOWER else value + delta
+        ret.append(Relaxation(subjects[r], kinds[r], value, relaxed))
+    return ret
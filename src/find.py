@@ -0,0 +1,227 @@
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from .cache import CACHE_ROOT
+from .catalog import Catalog, CatalogFood
+from .food import Food, current_catalog
+from .registry import Registry, registry
+
+# Fuzzy search over the names and descriptions of the registry's foods.
+# Texts are cut into character n-grams, trigrams of each word padded with a
+# space for latin words and single characters and pairs for Chinese ones,
+# which have no spaces between words, all without accents. A food scores the idf weighted share
+# of the query's n-grams it has, so typos and word order cost little.
+#
+# The index is one segment per catalog of the registry and one for the
+# members of Food, each in INDEX_DIR and rebuilt only when its catalog or
+# the descriptions of Food change. A segment file is
+#
+#     MAGIC, u64 length of the header, header as JSON, padding to ALIGN,
+#     int64 offsets, int32 postings, int32 text lengths
+#
+# where the header holds INDEX_VERSION, the key of the segment's source and
+# its n-grams, and the rows of n-gram i are postings[offsets[i]:offsets[i+1]].
+INDEX_VERSION = 1
+INDEX_DIR = CACHE_ROOT / "find"
+MAGIC = b"FOODIDX\0"
+ALIGN = 64
+
+WORD = re.compile(r"[^\W_]+")
+
+
+class Match(NamedTuple):
+    id: int
+    food: Food | CatalogFood
+    description: str
+    score: float  # Share of the query found, 1 for all of it
+
+
+class Segment:
+    def __init__(self, header: dict, offsets: np.ndarray, postings: np.ndarray, lengths: np.ndarray) -> None:
+        self.key = header["key"]
+        self.grams = {gram: i for i, gram in enumerate(header["grams"])}
+        self.offsets = offsets
+        self.postings = postings
+        self.lengths = lengths
+
+    def rows(self, gram: str) -> np.ndarray:
+        i = self.grams.get(gram)
+        if i is None:
+            return self.postings[:0]
+        return self.postings[self.offsets[i] : self.offsets[i + 1]]
+
+
+def grams(text: str) -> Set[str]:
+    if not text.isascii():
+        # Full width forms as ASCII, and without accents, "é" as "e"
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    text = text.lower()
+    ret = set()
+    for word in WORD.findall(text):
+        if any(_cjk(c) for c in word):
+            ret.update(word)
+            ret.update(word[i : i + 2] for i in range(len(word) - 1))
+        else:
+            word = f" {word} "
+            ret.update(word[i : i + 3] for i in range(len(word) - 2))
+    return ret
+
+
+def _cjk(c: str) -> bool:
+    return "\u2e80" <= c <= "\u9fff" or "\uf900" <= c <= "\ufaff"
+
+
+def build_segment(key: str, texts: List[str]) -> Segment:
+    rows: Dict[str, List[int]] = defaultdict(list)
+    for row, text in enumerate(texts):
+        for gram in grams(text):
+            rows[gram].append(row)
+    names = sorted(rows)
+    offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum([len(rows[gram]) for gram in names], out=offsets[1:])
+    postings = np.fromiter((row for gram in names for row in rows[gram]), dtype=np.int32, count=offsets[-1])
+    lengths = np.array([len(text) for text in texts], dtype=np.int32)
+    header = {"version": INDEX_VERSION, "key": key, "grams": names}
+    return Segment(header, offsets, postings, lengths)
+
+
+def write_segment(path: Path, segment: Segment):
+    header = json.dumps(
+        {"version": INDEX_VERSION, "key": segment.key, "grams": list(segment.grams)},
+        ensure_ascii=False,
+    ).encode()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array([len(header)], dtype="<u8").tobytes())
+        f.write(header)
+        f.write(b"\0" * (_data_offset(len(header)) - f.tell()))
+        for a, dtype in ((segment.offsets, "<i8"), (segment.postings, "<i4"), (segment.lengths, "<i4")):
+            f.write(np.ascontiguousarray(a, dtype=dtype).tobytes())
+    os.replace(tmp, path)
+
+
+# The segment of path when it was built from the source of key
+def open_segment(path: Path, key: str, rows: int) -> Optional[Segment]:
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            size = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            header = json.loads(f.read(size))
+    except (FileNotFoundError, ValueError, IndexError):
+        return None
+    if header.get("version") != INDEX_VERSION or header.get("key") != key:
+        return None
+
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=_data_offset(size)).view(np.ndarray)
+    end = 8 * (len(header["grams"]) + 1)
+    offsets = data[:end].view("<i8")
+    postings = data[end : end + 4 * int(offsets[-1])].view("<i4")
+    lengths = data[end + postings.nbytes :].view("<i4")
+    if len(lengths) != rows:
+        return None
+    return Segment(header, offsets, postings, lengths)
+
+
+def _data_offset(header_size: int) -> int:
+    end = len(MAGIC) + 8 + header_size
+    return -(-end // ALIGN) * ALIGN
+
+
+_segments: Dict[Path, Segment] = {}
+
+
+# Segments of the registry's foods in the order of its ids, each with the
+# id of its first row. Stale ones are built again and written, the others
+# mapped once per process.
+def segments(reg: Registry = registry) -> List[Tuple[int, Segment]]:
+    ret = []
+    compiled = current_catalog()
+    texts = [_member_text(food, compiled) for food in reg.members]
+    key = hashlib.sha1("\n".join(texts).encode()).hexdigest()
+    ret.append((0, _segment(INDEX_DIR / "food.idx", key, lambda: texts, len(texts))))
+    for catalog in reg.catalogs:
+        st = catalog.path.stat()
+        key = f"{st.st_size} {st.st_mtime_ns}"
+        digest = hashlib.sha1(str(catalog.path.resolve()).encode()).hexdigest()[:8]
+        path = INDEX_DIR / f"{catalog.path.stem}-{digest}.idx"
+        ret.append((reg.start(catalog), _segment(path, key, lambda c=catalog: _catalog_texts(c), len(catalog))))
+    return ret
+
+
+def _segment(path: Path, key: str, texts: Callable[[], List[str]], rows: int) -> Segment:
+    segment = _segments.get(path)
+    if segment is None or segment.key != key:
+        segment = open_segment(path, key, rows)
+    if segment is None:
+        segment = build_segment(key, texts())
+        write_segment(path, segment)
+    _segments[path] = segment
+    return segment
+
+
+def _member_text(food: Food, compiled: Catalog) -> str:
+    name = food.name.replace("_", " ")
+    i = compiled.index.get(food.name)
+    return name if i is None else f"{name} {compiled.descriptions[i]}"
+
+
+def _catalog_texts(catalog: Catalog) -> List[str]:
+    # Imported foods are named by their description, see fdc.py
+    return [
+        description if name.startswith(description) else f"{name} {description}"
+        for name, description in zip(catalog.names, catalog.descriptions)
+    ]
+
+
+def find(query: str, limit: int = 10, reg: Registry = registry) -> List[Match]:
+    wanted = grams(query)
+    segs = segments(reg)
+    total = sum(len(s.lengths) for _, s in segs)
+    if not wanted or not total:
+        return []
+
+    # Weights by how rare an n-gram is over all segments
+    df = {gram: sum(len(s.rows(gram)) for _, s in segs) for gram in wanted}
+    weights = {gram: math.log(1 + total / n) for gram, n in df.items() if n}
+    # An n-gram no food has is as rare as it gets
+    norm = sum(weights.get(gram, math.log(1 + total)) for gram in wanted)
+    scores = np.zeros(total, dtype=np.float32)
+    for start, segment in segs:
+        part = scores[start : start + len(segment.lengths)]
+        for gram, w in weights.items():
+            part[segment.rows(gram)] += w
+    scores /= norm
+
+    # The best limit, ties of the last one by the shortest text
+    hits = np.flatnonzero(scores)
+    if len(hits) > limit:
+        kth = np.partition(scores[hits], len(hits) - limit)[len(hits) - limit]
+        hits = hits[scores[hits] >= kth]
+    lengths = np.concatenate([s.lengths for _, s in segs])
+    hits = hits[np.lexsort((lengths[hits], -scores[hits]))][:limit]
+
+    compiled = current_catalog()
+    ret = []
+    for id in hits:
+        food = reg[int(id)]
+        ret.append(Match(int(id), food, _description(food, reg, compiled), float(scores[id])))
+    return ret
+
+
+def _description(food: Food | CatalogFood, reg: Registry, compiled: Catalog) -> str:
+    if isinstance(food, CatalogFood):
+        return reg.catalog(food).descriptions[food.row]
+    i = compiled.index.get(food.name)
+    return "" if i is None else compiled.descriptions[i]
@@ -1,13 +1,19 @@
-from collections import defaultdict
-from json import load, dump
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from json import dumps, load
 from pathlib import Path
 from enum import Enum, auto, unique
+from typing import Dict, Iterable, Optional, Tuple
 
+import numpy as np
+
+from .catalog import Catalog, CatalogFood, load_catalog, open_catalog, write_catalog
 from .food_getters.usda import convert_cooked_chicken_breast_to_uncoocked
 from .food_getters.usda import usda
 from .units import KG, MCG, MG, G
 from .food_getters.chinanutri import chinanutri
-from .nutrient import Nutrient, Nutrients
+from .nutrient import NUTRIENTS, Nutrient, Nutrients, to_vector
 
 
 @unique
@@ -177,6 +183,68 @@ GETTERS = {
 }
 
 
+# Foods that only come in whole units, used by RecipeSolver(discrete=True)
+UNITS = {
+    Food.EGG: 50 * G,
+}
+
+
+FOODS_DIR = Path("foods")
+CATALOG_PATH = FOODS_DIR / "catalog.bin"
+# Of import-fdc, its foods are CatalogFoods
+USDA_CATALOG_PATH = FOODS_DIR / "usda.bin"
+
+VECTOR_CACHE_BYTES = 16 * 2**20
+
+# Opened once per process, see get_vector
+_catalog: Optional[Catalog] = None
+
+
+# The vectors get_vector returned in this process, each with the mtime and
+# size of the JSON file it came from, so that an entry is only reused while
+# the file is unchanged. Past max_bytes of vectors, the least recently used
+# are dropped.
+class VectorCache:
+    hits: int
+    misses: int
+
+    def __init__(self, max_bytes: int = VECTOR_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.memory: OrderedDict[Food, Tuple[Tuple[int, int], np.ndarray]] = OrderedDict()
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, food: Food, stat: Tuple[int, int]) -> Optional[np.ndarray]:
+        entry = self.memory.get(food)
+        if entry is None or entry[0] != stat:
+            self.misses += 1
+            return None
+        self.memory.move_to_end(food)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, food: Food, stat: Tuple[int, int], vec: np.ndarray):
+        old = self.memory.pop(food, None)
+        if old is not None:
+            self.used -= old[1].nbytes
+        self.memory[food] = (stat, vec)
+        self.used += vec.nbytes
+        while self.used > self.max_bytes and len(self.memory) > 1:
+            _, (_, dropped) = self.memory.popitem(last=False)
+            self.used -= dropped.nbytes
+
+    def clear(self):
+        self.memory.clear()
+        self.used = 0
+
+    def __repr__(self) -> str:
+        return f"VectorCache(hits={self.hits}, misses={self.misses}, bytes={self.used})"
+
+
+vectors = VectorCache()
+
+
 def get_or_load(food: Food) -> Nutrients:
     getter = GETTERS[food]
     if isinstance(getter, dict):
@@ -186,26 +254,163 @@ def get_or_load(food: Food) -> Nutrients:
     else:
         raise NotImplementedError
 
-    Path("foods").mkdir(parents=True, exist_ok=True)
-
     try:
-        with open(f"foods/{food.name}.json") as f:
-            serde = load(f)
-            nuts = defaultdict(int, {Nutrient[k]: v for k, v in serde.items() if k != "__name__"})
-            return nuts
+        return _read_json(FOODS_DIR / f"{food.name}.json")[1]
     except FileNotFoundError:
         pass
 
     print(f"Getting nutrients for {food.name}")
-    name, nuts = getter()
+    return _fetch(food)
+
 
-    with open(f"foods/{food.name}.json", "w+") as f:
-        dump(
-            {"__name__": name, **{k.name: v for k, v in nuts.items()}},
-            f,
-            indent=4,
-            sort_keys=True,
-            ensure_ascii=False,
-        )
+def _fetch(food: Food) -> Nutrients:
+    name, nuts = GETTERS[food]()
+    text = dumps(
+        {"__name__": name, **{k.name: v for k, v in nuts.items()}},
+        indent=4,
+        sort_keys=True,
+        ensure_ascii=False,
+    )
 
+    path = FOODS_DIR / f"{food.name}.json"
+    try:
+        # Unchanged files keep their mtime, and their row of the catalog
+        if path.read_text() == text:
+            return nuts
+    except FileNotFoundError:
+        pass
+    FOODS_DIR.mkdir(parents=True, exist_ok=True)
+    # Written aside and renamed, so that no reader sees half of the file
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
     return nuts
+
+
+# Fetches the foods, all of GETTERS by default, that are missing from
+# foods/*.json, workers at a time, or all of them with every. The getters'
+# http.mode decides whether that goes to the network. Returns the error of
+# each food that failed, the others are fetched regardless.
+def prefetch(
+    foods: Optional[Iterable[Food]] = None,
+    workers: int = 8,
+    every: bool = False,
+) -> Dict[Food, Exception]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    missing = [
+        food
+        for food in (GETTERS if foods is None else foods)
+        if callable(GETTERS[food]) and (every or not (FOODS_DIR / f"{food.name}.json").exists())
+    ]
+
+    def fetch(food: Food) -> Optional[Exception]:
+        try:
+            _fetch(food)
+        except Exception as e:
+            return e
+        return None
+
+    with ThreadPoolExecutor(workers) as pool:
+        errors = dict(zip(missing, pool.map(fetch, missing)))
+    return {food: e for food, e in errors.items() if e is not None}
+
+
+def _read_json(path: Path) -> Tuple[str, Nutrients]:
+    with open(path) as f:
+        serde = load(f)
+    nuts = defaultdict(int, {Nutrient[k]: v for k, v in serde.items() if k != "__name__"})
+    return serde.get("__name__", path.stem), nuts
+
+
+# The nutrients of food as a vector over NUTRIENTS, a read only row of the
+# catalog when it is up to date with the food's JSON file. An out of date
+# catalog is rebuilt, and a food that was never fetched goes through
+# get_or_load and joins the catalog on its next build. Repeated calls are
+# answered from vectors while the JSON file keeps its mtime and size. A
+# CatalogFood is its row of its own catalog.
+def get_vector(food: Food | CatalogFood) -> np.ndarray:
+    if isinstance(food, CatalogFood):
+        catalog = load_catalog(Path(food.path))
+        if catalog is None or food.row >= len(catalog) or catalog.names[food.row] != food.name:
+            raise KeyError(f"{food.name} is not in {food.path}")
+        return catalog.matrix[food.row]
+
+    getter = GETTERS[food]
+    if isinstance(getter, dict):
+        stat = (0, 0)
+    else:
+        try:
+            st = (FOODS_DIR / f"{food.name}.json").stat()
+        except FileNotFoundError:
+            return to_vector(get_or_load(food))
+        stat = (st.st_mtime_ns, st.st_size)
+
+    vec = vectors.get(food, stat)
+    if vec is None:
+        if isinstance(getter, dict):
+            # Shared by every solver, like the rows of the catalog
+            vec = to_vector(getter)
+            vec.flags.writeable = False
+        else:
+            vec = _catalog_vector(food, stat[0])
+        vectors.put(food, stat, vec)
+    return vec
+
+
+def _catalog_vector(food: Food, mtime: int) -> np.ndarray:
+    global _catalog
+    if _catalog is None:
+        _catalog = open_catalog(CATALOG_PATH)
+    vec = None if _catalog is None else _catalog.vector(food.name, mtime)
+    if vec is None:
+        _catalog = build_catalog()
+        vec = _catalog.vector(food.name, mtime)
+    return to_vector(get_or_load(food)) if vec is None else vec
+
+
+# The catalog, built again when a food's JSON file was written since
+def current_catalog() -> Catalog:
+    catalog = open_catalog(CATALOG_PATH)
+    for food, getter in GETTERS.items():
+        if catalog is None:
+            break
+        if isinstance(getter, dict):
+            continue
+        try:
+            mtime = (FOODS_DIR / f"{food.name}.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            continue
+        i = catalog.index.get(food.name)
+        if i is None or catalog.mtimes[i] != mtime:
+            catalog = None
+    return build_catalog() if catalog is None else catalog
+
+
+# Compiles the foods of GETTERS whose nutrients are at hand, inline or in
+# foods/*.json, into one catalog. Nothing is fetched.
+def build_catalog(path: Path = CATALOG_PATH) -> Catalog:
+    names, descriptions, sources, mtimes, rows = [], [], [], [], []
+    for food, getter in GETTERS.items():
+        if isinstance(getter, dict):
+            description, nuts, source, mtime = food.name, getter, "inline", 0
+        else:
+            json_path = FOODS_DIR / f"{food.name}.json"
+            try:
+                # Before reading, a file changed in between is just rebuilt again
+                mtime = json_path.stat().st_mtime_ns
+                description, nuts = _read_json(json_path)
+            except FileNotFoundError:
+                continue
+            source = getter.source
+        names.append(food.name)
+        descriptions.append(description)
+        sources.append(source)
+        mtimes.append(mtime)
+        rows.append(to_vector(nuts))
+
+    matrix = np.array(rows, dtype=np.float64).reshape(len(rows), len(NUTRIENTS))
+    write_catalog(path, names, descriptions, sources, mtimes, matrix)
+    catalog = open_catalog(path)
+    assert catalog is not None
+    return catalog
@@ -0,0 +1,226 @@
+# FROM https://fdc.nal.usda.gov/download-datasets
+#
+# Imports a bulk JSON download of FoodData Central, Foundation, SR Legacy or
+# Branded, into a catalog of its own, see catalog.CatalogFood. The file is
+# read one food at a time and the rows are appended to a part file, so memory
+# does not grow with the download but with the names only. Every CHECKPOINT
+# foods the parts are synced and the offset in the download is saved, an
+# interrupted import goes on from there.
+
+import codecs
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from ..catalog import write_catalog
+from ..nutrient import NUTRIENTS, Nutrient, to_vector
+from .usda import convert
+
+logger = logging.getLogger(__name__)
+
+CHUNK = 1 << 20  # Bytes read at a time
+CHECKPOINT = 1000
+PROGRESS_SECONDS = 5.0
+
+# The unit names of the downloads and the API, as normalize() knows them
+UNIT_NAMES = {"G": "g", "MG": "mg", "UG": "µg", "KCAL": "kcal", "KJ": "kJ"}
+
+# Used when a food lacks the name NAME_TO_ENUM has, SR Legacy has no
+# Atwater energy
+FALLBACKS = {"Energy": "Energy (Atwater General Factors)"}
+
+
+class ImportResult(NamedTuple):
+    foods: int
+    skipped: int  # Foods without a nutrient we track
+    unknown: Counter  # Nutrient names NAME_TO_ENUM does not know, or units
+    resumed: int  # Foods of an earlier run
+
+
+def import_fdc(src: Path, path: Path, resume: bool = True) -> ImportResult:
+    rows_path = path.with_suffix(".rows.part")
+    foods_path = path.with_suffix(".foods.part")
+    progress_path = path.with_suffix(".progress")
+    st = src.stat()
+    input = {"src": str(src.resolve()), "size": st.st_size, "mtime": st.st_mtime_ns}
+    row_bytes = len(NUTRIENTS) * 8
+
+    progress = _load_progress(progress_path) if resume else None
+    if progress is None or progress["input"] != input:
+        progress = {"input": input, "offset": 0, "foods": 0, "skipped": 0, "foods_bytes": 0}
+        for part in (rows_path, foods_path):
+            part.unlink(missing_ok=True)
+    names = set()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for part in (rows_path, foods_path):
+        part.touch()
+    with open(rows_path, "r+b") as rows, open(foods_path, "r+b") as foods:
+        # Whatever was written after the checkpoint is written again
+        rows.truncate(progress["foods"] * row_bytes)
+        foods.truncate(progress["foods_bytes"])
+        rows.seek(0, os.SEEK_END)
+        foods.seek(0, os.SEEK_END)
+        with open(foods_path, "rb") as f:
+            for line in f:
+                names.add(json.loads(line)[0])
+        if len(names) != progress["foods"] or os.path.getsize(rows_path) != progress["foods"] * row_bytes:
+            raise ValueError(f"{rows_path} or {foods_path} is shorter than {progress_path} says, import again")
+        resumed = count = progress["foods"]
+        if resumed:
+            logger.info("Resuming %s at %d foods", src.name, resumed)
+
+        skipped = progress["skipped"]
+        unknown = Counter()
+        last = time.monotonic()
+        with open(src, "rb") as f:
+            for record, offset in records(f, progress["offset"]):
+                food = _food(record, unknown)
+                if food is None:
+                    skipped += 1
+                else:
+                    name, description, source, vec = food
+                    if name in names:
+                        name = f"{name} ({source})"
+                    names.add(name)
+                    rows.write(vec.tobytes())
+                    foods.write(json.dumps([name, description, source], ensure_ascii=False).encode() + b"\n")
+                    count += 1
+
+                if (count + skipped) % CHECKPOINT == 0:
+                    progress.update(offset=offset, foods=count, skipped=skipped, foods_bytes=foods.tell())
+                    _checkpoint(progress_path, progress, rows, foods)
+                if time.monotonic() - last > PROGRESS_SECONDS:
+                    last = time.monotonic()
+                    logger.info("%d foods, %.0f%% of %s", count, 100 * offset / max(st.st_size, 1), src.name)
+        progress.update(offset=st.st_size, foods=count, skipped=skipped, foods_bytes=foods.tell())
+        _checkpoint(progress_path, progress, rows, foods)
+
+    names, descriptions, sources = [], [], []
+    with open(foods_path, "rb") as f:
+        for line in f:
+            name, description, source = json.loads(line)
+            names.append(name)
+            descriptions.append(description)
+            sources.append(source)
+    if count:
+        matrix = np.memmap(rows_path, dtype="<f8", mode="r", shape=(count, len(NUTRIENTS)))
+    else:
+        matrix = np.zeros((0, len(NUTRIENTS)))
+    write_catalog(path, names, descriptions, sources, [0] * count, matrix)
+    del matrix
+    for part in (rows_path, foods_path, progress_path):
+        part.unlink()
+    logger.info("%d foods in %s", count, path)
+    return ImportResult(count, skipped, unknown, resumed)
+
+
+# Name, description, source and nutrients of a food of the download, None
+# when it has none of the nutrients we track
+def _food(record: dict, unknown: Counter) -> Optional[Tuple[str, str, str, np.ndarray]]:
+    nuts: Dict[Nutrient, float] = {}
+    fallbacks: Dict[Nutrient, float] = {}
+    for nut in record.get("foodNutrients", []):
+        if "amount" not in nut or "nutrient" not in nut:
+            continue
+        name = nut["nutrient"].get("name") or ""
+        unit = (nut["nutrient"].get("unitName") or "").strip()
+        # Without a unit, the amount of a nutrient can not be converted
+        if not name or not unit:
+            continue
+        unit = UNIT_NAMES.get(unit.upper(), unit)
+        try:
+            converted = convert(FALLBACKS[name] if name in FALLBACKS else name, nut["amount"], unit)
+        except KeyError:
+            unknown[name] += 1
+            continue
+        except NotImplementedError:
+            unknown[f"{name} [{unit}]"] += 1
+            continue
+        if converted is not None:
+            (fallbacks if name in FALLBACKS else nuts)[converted[0]] = converted[1]
+    for n, v in fallbacks.items():
+        nuts.setdefault(n, v)
+    if not nuts:
+        return None
+
+    fdc_id = record.get("fdcId")
+    description = record.get("description") or f"FDC {fdc_id}"
+    return description, description, f"usda:{fdc_id}", to_vector(nuts)
+
+
+def _load_progress(path: Path) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+# The parts are on disk before the progress that counts them
+def _checkpoint(path: Path, progress: dict, *parts: BinaryIO):
+    for part in parts:
+        part.flush()
+        os.fsync(part.fileno())
+    tmp = path.with_suffix(".progress.tmp")
+    with open(tmp, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp, path)
+
+
+WS = re.compile(r"[ \t\r\n]*")
+
+
+# The objects of the first array of a JSON file, {"FoundationFoods": [...]}
+# of a download, one at a time with the offset in bytes right after each. An
+# offset from there resumes after that object. Holds a chunk and an object
+# at most, json can not parse a stream.
+def records(f: BinaryIO, offset: int = 0, chunk: int = CHUNK) -> Iterator[Tuple[dict, int]]:
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    f.seek(offset)
+    buf, i, pos = "", 0, offset  # pos is the offset of buf[i]
+    in_array, value = offset > 0, False  # value: an object is next, not , or ]
+    eof = False
+    while True:
+        space = WS.match(buf, i)
+        assert space is not None  # WS matches the empty string
+        j = space.end()
+        pos, i = pos + j - i, j
+        if i < len(buf):
+            if not in_array:
+                k = buf.find("[", i)
+                in_array = value = k >= 0
+                j = len(buf) if k < 0 else k + 1
+                pos, i = pos + len(buf[i:j].encode()), j
+                continue
+            if buf[i] == "]":
+                return
+            if not value:
+                if buf[i] != ",":
+                    raise ValueError(f"Expected , or ] at byte {pos} of {f.name}")
+                pos, i, value = pos + 1, i + 1, True
+                continue
+            try:
+                obj, j = decoder.raw_decode(buf, i)
+            except json.JSONDecodeError:
+                # Most likely cut off by the end of the chunk
+                if eof:
+                    raise
+            else:
+                pos, i, value = pos + len(buf[i:j].encode()), j, False
+                yield obj, pos
+                continue
+        if eof:
+            if in_array:
+                raise ValueError(f"{f.name} ends inside the array")
+            return
+        data = f.read(chunk)
+        eof = not data
+        buf, i = buf[i:] + utf8.decode(data, final=eof), 0
@@ -0,0 +1,18 @@
+from collections.abc import Callable
+from typing import Dict, Tuple
+
+from ..nutrient import Nutrient
+
+
+# Fetches the name and nutrients per g of a food, and knows where from:
+# source is an id like "usda:748967", see Registry.get
+class Getter:
+    def __init__(self, fetch: Callable[[], Tuple[str, Dict[Nutrient, float]]], source: str) -> None:
+        self.fetch = fetch
+        self.source = source
+
+    def __call__(self) -> Tuple[str, Dict[Nutrient, float]]:
+        return self.fetch()
+
+    def __repr__(self) -> str:
+        return f"Getter({self.source!r})"
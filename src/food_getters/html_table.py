@@ -0,0 +1,115 @@
+from html.parser import HTMLParser
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class Cell(NamedTuple):
+    classes: List[str]
+    text: str
+
+
+# The text of the first div.<title_class>>h1, and the cells of every tr in a
+# div.<table_class> as BeautifulSoup's select("td") of the row would give
+# them. Only tokenizes html from the first of the two on, and stops after
+# the table once it has the title, so the rest of the page costs nothing.
+def extract(html: str, title_class: str, table_class: str) -> Tuple[Optional[str], List[List[Cell]]]:
+    marks = [i for i in (html.find(title_class), html.find(table_class)) if i >= 0]
+    start = max(html.rfind("<", 0, min(marks)), 0) if marks else 0
+    page = _Page(title_class, table_class)
+    try:
+        page.feed(html[start:])
+        page.close()
+    except _Done:
+        pass
+    title = None if page.title is None else "".join(page.title)
+    return title, [[Cell(classes, "".join(text)) for classes, text in row] for row in page.cells]
+
+
+class _Done(Exception):
+    pass
+
+
+# Elements without an end tag, as BeautifulSoup's html.parser builder has them
+VOID = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen",
+    "link", "menuitem", "meta", "param", "source", "track", "wbr",
+}
+
+
+# Follows the open elements like BeautifulSoup does: an end tag closes the
+# latest open element of its name and all opened after it.
+class _Page(HTMLParser):
+    def __init__(self, title_class: str, table_class: str) -> None:
+        super().__init__(convert_charrefs=True)
+        self.title_class = title_class
+        self.table_class = table_class
+        # Open elements, tag and classes
+        self.stack: List[Tuple[str, List[str]]] = []
+        self.table: Optional[int] = None  # Depth of the outermost table div
+        self.title: Optional[List[str]] = None
+        self.title_depth: Optional[int] = None
+        # Cells as classes and text parts, a td is in every tr it is nested in
+        self.cells: List[List[Tuple[List[str], List[str]]]] = []
+        self.open_rows: List[int] = []  # Depths
+        self.open_cells: List[Tuple[int, List[str]]] = []  # Depth, text parts
+
+    def handle_starttag(self, tag, attrs):
+        classes = []
+        for k, v in attrs:
+            if k == "class" and v:
+                classes = v.split()
+        depth = len(self.stack)
+
+        if tag == "h1" and self.title is None and self.stack:
+            parent, parent_classes = self.stack[-1]
+            if parent == "div" and self.title_class in parent_classes:
+                self.title, self.title_depth = [], depth
+        if self.table is None:
+            if tag == "div" and self.table_class in classes:
+                self.table = depth
+        elif tag == "tr":
+            self.open_rows.append(depth)
+            self.cells.append([])
+        elif tag == "td" and self.open_rows:
+            text = []
+            self.open_cells.append((depth, text))
+            for row in self.cells[len(self.cells) - len(self.open_rows) :]:
+                row.append((classes, text))
+
+        self.stack.append((tag, classes))
+        if tag in VOID:
+            self._close(depth)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID:
+            self._close(len(self.stack) - 1)
+
+    def handle_endtag(self, tag):
+        for depth in range(len(self.stack) - 1, -1, -1):
+            if self.stack[depth][0] == tag:
+                self._close(depth)
+                return
+
+    def handle_data(self, data):
+        if self.title_depth is not None and self.title is not None:
+            self.title.append(data)
+        for _, text in self.open_cells:
+            text.append(data)
+
+    def close(self):
+        super().close()
+        self._close(0)
+
+    # Closes the elements from depth on
+    def _close(self, depth: int):
+        del self.stack[depth:]
+        while self.open_cells and self.open_cells[-1][0] >= depth:
+            self.open_cells.pop()
+        while self.open_rows and self.open_rows[-1] >= depth:
+            self.open_rows.pop()
+        if self.title_depth is not None and self.title_depth >= depth:
+            self.title_depth = None
+        if self.table is not None and self.table >= depth:
+            self.table = None
+            if self.title is not None and self.title_depth is None:
+                raise _Done
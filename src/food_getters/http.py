@@ -0,0 +1,195 @@
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from enum import Enum, auto
+from pathlib import Path
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..cache import CACHE_ROOT
+
+# The getters fetch through get(), with one keep-alive session per host that
+# all threads share, at most RATE requests per second to a host, and RETRIES
+# retries of connection errors and 429/5xx responses, BACKOFF seconds after
+# the first and twice as long after each next one.
+TIMEOUT = 30
+RETRIES = 4
+BACKOFF = 0.5
+RATE = 8.0
+POOL_SIZE = 16
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Every response body is kept gzipped in RESPONSE_DIR with its validators, so
+# that a change to a parser only needs the stored responses, see Mode
+RESPONSE_DIR = Path(os.environ.get("FOOD_SOLVER_RESPONSES") or CACHE_ROOT / "responses")
+
+
+class Mode(Enum):
+    # Stored responses are used as they are, the others fetched
+    STORED = auto()
+    # Stored responses are revalidated by conditional GETs, a 304 keeps them
+    REFRESH = auto()
+    # Only stored responses, without network
+    OFFLINE = auto()
+
+
+mode = Mode.STORED
+
+
+class Response(NamedTuple):
+    url: str
+    body: bytes
+    encoding: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(self.encoding, errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class _Host:
+    def __init__(self, rate: float) -> None:
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next = 0.0
+
+    # Takes the next free slot of the rate limit, and sleeps until it
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next)
+            self.next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_hosts: Dict[str, _Host] = {}
+_hosts_lock = threading.Lock()
+
+
+def _host(url: str) -> _Host:
+    netloc = urlsplit(url).netloc
+    with _hosts_lock:
+        if netloc not in _hosts:
+            _hosts[netloc] = _Host(RATE)
+        return _hosts[netloc]
+
+
+def get(url: str) -> Response:
+    stored = _load(url)
+    if stored is not None and mode != Mode.REFRESH:
+        return stored
+    if mode == Mode.OFFLINE:
+        raise LookupError(f"No stored response for {url}")
+
+    headers = {}
+    if stored is not None and stored.etag:
+        headers["If-None-Match"] = stored.etag
+    if stored is not None and stored.last_modified:
+        headers["If-Modified-Since"] = stored.last_modified
+    resp = _get(url, headers)
+    if resp.status_code == 304 and stored is not None:
+        return stored
+
+    response = Response(
+        url,
+        resp.content,
+        # What requests would decode .text with
+        resp.encoding or resp.apparent_encoding or "utf-8",
+        resp.headers.get("ETag"),
+        resp.headers.get("Last-Modified"),
+    )
+    _store(response)
+    return response
+
+
+def _get(url: str, headers: Dict[str, str]) -> requests.Response:
+    host = _host(url)
+    for attempt in range(RETRIES + 1):
+        host.wait()
+        try:
+            resp = host.session.get(url, headers=headers, timeout=TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == RETRIES:
+                raise
+            resp = None
+
+        if resp is not None and (resp.status_code not in RETRY_STATUS or attempt == RETRIES):
+            resp.raise_for_status()
+            return resp
+
+        delay = BACKOFF * 2**attempt
+        retry_after = resp.headers.get("Retry-After", "") if resp is not None else ""
+        if retry_after.isdigit():
+            delay = max(delay, int(retry_after))
+        # Jitter, so that threads that failed together do not retry together
+        time.sleep(delay * (1 + random.random() / 2))
+    raise AssertionError("unreachable")
+
+
+# The stored responses of the URLs starting with prefix
+def stored(prefix: str = "") -> Iterator[Response]:
+    for path in sorted(RESPONSE_DIR.glob("*.gz")):
+        try:
+            with gzip.open(path, "rb") as f:
+                url = json.loads(f.readline())["url"]
+        except (OSError, EOFError, ValueError, KeyError):
+            continue
+        if url.startswith(prefix):
+            response = _load(url)
+            if response is not None:
+                yield response
+
+
+def _path(url: str) -> Path:
+    return RESPONSE_DIR / f"{hashlib.sha1(url.encode()).hexdigest()}.gz"
+
+
+# A stored response is one gzip stream, a line of JSON with everything but
+# the body and then the body
+def _load(url: str) -> Optional[Response]:
+    try:
+        with gzip.open(_path(url), "rb") as f:
+            meta = json.loads(f.readline())
+            body = f.read()
+    except (FileNotFoundError, OSError, EOFError, ValueError):
+        return None
+    if meta.get("url") != url:
+        return None
+    return Response(url, body, meta["encoding"], meta["etag"], meta["last_modified"])
+
+
+def _store(response: Response):
+    meta = {
+        "url": response.url,
+        "encoding": response.encoding,
+        "etag": response.etag,
+        "last_modified": response.last_modified,
+    }
+    path = _path(response.url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with gzip.open(tmp, "wb") as f:
+            f.write(json.dumps(meta).encode() + b"\n")
+            f.write(response.body)
+        os.replace(tmp, path)
+    except BaseException:
+        # The stored response, if any, stays as it was
+        tmp.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,289 @@
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+from . import http
+
+# A local HTTP server to check http.get against, without the real hosts.
+# Every path has a route, which answers the n-th request to the path given
+# its headers. The server records each request with its headers, status and
+# client port, so that a check can tell retries and connections apart.
+
+
+class Reply(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+class Request(NamedTuple):
+    headers: Dict[str, str]
+    status: int
+    port: int
+
+
+Route = Callable[[int, Dict[str, str]], Reply]
+
+
+class StubServer:
+    def __init__(self, routes: Dict[str, Route]) -> None:
+        self.routes = routes
+        self.requests: Dict[str, List[Request]] = defaultdict(list)
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, as the real hosts do
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                headers = dict(self.headers.items())
+                with stub.lock:
+                    n = len(stub.requests[self.path])
+                    route = stub.routes.get(self.path)
+                    reply = Reply(404, {}, b"") if route is None else route(n, headers)
+                    stub.requests[self.path].append(Request(headers, reply.status, self.client_address[1]))
+                self.send_response(reply.status)
+                for k, v in reply.headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(reply.body)))
+                self.end_headers()
+                self.wfile.write(reply.body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self) -> "StubServer":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _ok(n: int, headers: Dict[str, str]) -> Reply:
+    return Reply(200, {}, b"ok")
+
+
+# 503 twice, then the body
+def _flaky(n: int, headers: Dict[str, str]) -> Reply:
+    return Reply(503, {}, b"") if n < 2 else Reply(200, {}, b"ok")
+
+
+# 429 asking to wait a second, then the body
+def _busy(n: int, headers: Dict[str, str]) -> Reply:
+    return Reply(429, {"Retry-After": "1"}, b"") if n == 0 else Reply(200, {}, b"ok")
+
+
+def _down(n: int, headers: Dict[str, str]) -> Reply:
+    return Reply(500, {}, b"")
+
+
+def _etag(n: int, headers: Dict[str, str]) -> Reply:
+    if headers.get("If-None-Match") == '"v1"':
+        return Reply(304, {}, b"")
+    return Reply(200, {"ETag": '"v1"'}, b"v1")
+
+
+LAST_MODIFIED = "Wed, 21 Oct 2015 07:28:00 GMT"
+
+
+def _last_modified(n: int, headers: Dict[str, str]) -> Reply:
+    if headers.get("If-Modified-Since") == LAST_MODIFIED:
+        return Reply(304, {}, b"")
+    return Reply(200, {"Last-Modified": LAST_MODIFIED}, b"v1")
+
+
+# v1 on the first request, v2 on the ones after
+def _changed(n: int, headers: Dict[str, str]) -> Reply:
+    version = "v1" if n == 0 else "v2"
+    if headers.get("If-None-Match") == f'"{version}"':
+        return Reply(304, {}, b"")
+    return Reply(200, {"ETag": f'"{version}"'}, version.encode())
+
+
+ROUTES: Dict[str, Route] = {
+    "/flaky": _flaky,
+    "/busy": _busy,
+    "/down": _down,
+    "/etag": _etag,
+    "/last-modified": _last_modified,
+    "/changed": _changed,
+    **{f"/ok/{i}": _ok for i in range(5)},
+}
+
+
+class Check(NamedTuple):
+    name: str
+    ok: bool
+    detail: str
+
+
+def _retry_5xx(stub: StubServer) -> Tuple[bool, str]:
+    body = http.get(f"{stub.url}/flaky").body
+    statuses = [r.status for r in stub.requests["/flaky"]]
+    return body == b"ok" and statuses == [503, 503, 200], f"statuses {statuses}"
+
+
+def _retry_after(stub: StubServer) -> Tuple[bool, str]:
+    start = time.monotonic()
+    body = http.get(f"{stub.url}/busy").body
+    waited = time.monotonic() - start
+    statuses = [r.status for r in stub.requests["/busy"]]
+    return body == b"ok" and statuses == [429, 200] and waited >= 1, f"statuses {statuses}, waited {waited:.2f} s"
+
+
+def _give_up(stub: StubServer) -> Tuple[bool, str]:
+    try:
+        http.get(f"{stub.url}/down")
+        raised = "nothing"
+    except http.requests.HTTPError as e:
+        raised = type(e).__name__
+    tries = len(stub.requests["/down"])
+    return raised == "HTTPError" and tries == http.RETRIES + 1, f"raised {raised} after {tries} requests"
+
+
+def _no_retry_404(stub: StubServer) -> Tuple[bool, str]:
+    try:
+        http.get(f"{stub.url}/missing")
+        raised = "nothing"
+    except http.requests.HTTPError as e:
+        raised = type(e).__name__
+    tries = len(stub.requests["/missing"])
+    return raised == "HTTPError" and tries == 1, f"raised {raised} after {tries} requests"
+
+
+def _keep_alive(stub: StubServer) -> Tuple[bool, str]:
+    for i in range(5):
+        http.get(f"{stub.url}/ok/{i}")
+    ports = {r.port for i in range(5) for r in stub.requests[f"/ok/{i}"]}
+    return len(ports) == 1, f"{len(ports)} connections for 5 requests"
+
+
+def _stored(stub: StubServer) -> Tuple[bool, str]:
+    first, second = http.get(f"{stub.url}/ok/0"), http.get(f"{stub.url}/ok/0")
+    tries = len(stub.requests["/ok/0"])
+    return first == second and tries == 1, f"{tries} requests for 2 gets"
+
+
+# Fetched, then revalidated with mode REFRESH: the server has to see the
+# validator and the stored body has to come back on its 304
+def _revalidate(stub: StubServer, path: str, header: str) -> Tuple[bool, str]:
+    first = http.get(f"{stub.url}{path}")
+    http.mode = http.Mode.REFRESH
+    try:
+        second = http.get(f"{stub.url}{path}")
+    finally:
+        http.mode = http.Mode.STORED
+    requests = stub.requests[path]
+    statuses = [r.status for r in requests]
+    sent = requests[-1].headers.get(header)
+    return second == first and statuses == [200, 304] and sent is not None, f"statuses {statuses}, {header} {sent}"
+
+
+def _etag_304(stub: StubServer) -> Tuple[bool, str]:
+    return _revalidate(stub, "/etag", "If-None-Match")
+
+
+def _last_modified_304(stub: StubServer) -> Tuple[bool, str]:
+    return _revalidate(stub, "/last-modified", "If-Modified-Since")
+
+
+def _changed_200(stub: StubServer) -> Tuple[bool, str]:
+    http.get(f"{stub.url}/changed")
+    http.mode = http.Mode.REFRESH
+    try:
+        fetched = http.get(f"{stub.url}/changed")
+    finally:
+        http.mode = http.Mode.STORED
+    stored = http.get(f"{stub.url}/changed")
+    tries = len(stub.requests["/changed"])
+    return (
+        fetched.body == stored.body == b"v2" and stored.etag == '"v2"' and tries == 2,
+        f"stored {stored.body!r} with {stored.etag}",
+    )
+
+
+def _offline(stub: StubServer) -> Tuple[bool, str]:
+    http.mode = http.Mode.OFFLINE
+    try:
+        http.get(f"{stub.url}/offline")
+        raised = "nothing"
+    except LookupError as e:
+        raised = type(e).__name__
+    finally:
+        http.mode = http.Mode.STORED
+    tries = len(stub.requests["/offline"])
+    return raised == "LookupError" and tries == 0, f"raised {raised} after {tries} requests"
+
+
+# Threads storing one URL at once leave one whole response, and a store that
+# fails midway leaves the one before, both without temporary files
+def _atomic_store(stub: StubServer) -> Tuple[bool, str]:
+    url = f"{stub.url}/atomic"
+    bodies = [bytes([i]) * 2**16 for i in range(8)]
+    threads = [
+        threading.Thread(target=http._store, args=(http.Response(url, body, "utf-8", None, None),))
+        for body in bodies
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    raced = http._load(url)
+
+    try:
+        http._store(http.Response(url, None, "utf-8", None, None))  # type: ignore[arg-type]
+        failed = "nothing"
+    except TypeError as e:
+        failed = type(e).__name__
+    kept = http._load(url)
+    leftovers = list(http.RESPONSE_DIR.glob("*.tmp"))
+    return (
+        raced is not None and raced.body in bodies and kept == raced and failed == "TypeError" and not leftovers,
+        f"whole after race {raced is not None and raced.body in bodies}, "
+        f"kept after failed store {kept == raced}, {len(leftovers)} temporary files",
+    )
+
+
+CHECKS: List[Tuple[str, Callable[[StubServer], Tuple[bool, str]]]] = [
+    ("retries 503 with backoff", _retry_5xx),
+    ("waits for Retry-After of 429", _retry_after),
+    ("gives up after RETRIES", _give_up),
+    ("does not retry 404", _no_retry_404),
+    ("keeps the connection alive", _keep_alive),
+    ("uses the stored response", _stored),
+    ("revalidates with If-None-Match, keeps it on 304", _etag_304),
+    ("revalidates with If-Modified-Since, keeps it on 304", _last_modified_304),
+    ("stores the new response on 200", _changed_200),
+    ("only stored responses offline", _offline),
+    ("stores atomically", _atomic_store),
+]
+
+
+# Runs CHECKS against a StubServer, with the responses stored in a temporary
+# directory and short backoffs. The settings of http are restored after.
+def check_fetch() -> List[Check]:
+    saved = http.RESPONSE_DIR, http.mode, http.BACKOFF, http.RATE
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, StubServer(ROUTES) as stub:
+        http.RESPONSE_DIR, http.mode, http.BACKOFF, http.RATE = Path(tmp), http.Mode.STORED, 0.01, 1000.0
+        try:
+            for name, check in CHECKS:
+                try:
+                    ok, detail = check(stub)
+                except Exception as e:
+                    ok, detail = False, repr(e)
+                results.append(Check(name, ok, detail))
+        finally:
+            http.RESPONSE_DIR, http.mode, http.BACKOFF, http.RATE = saved
+    return results
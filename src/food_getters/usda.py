@@ -1,20 +1,23 @@
 # FROM https://fdc.nal.usda.gov/index.html
 
-from collections.abc import Callable
-from typing import Dict, Tuple
-
-import requests
+import os
+from typing import Dict, Optional, Tuple
 
 from ..food_getters.chinanutri import normalize
 from ..nutrient import Nutrient
+from .getter import Getter
 from ..units import VITAMIN_D_IU
 
+BASE_URL = os.environ.get("USDA_URL", "https://fdc.nal.usda.gov")
+
 
-def usda(id: int) -> Callable[[], Tuple[str, Dict[Nutrient, float]]]:
+def usda(id: int) -> Getter:
     def inner() -> Tuple[str, Dict[Nutrient, float]]:
+        from .http import get
+
         ret = {}
 
-        resp = requests.get(f"https://fdc.nal.usda.gov/portal-data/external/{id}")
+        resp = get(f"{BASE_URL}/portal-data/external/{id}")
         data = resp.json()
         food_name = data["description"]
 
@@ -28,43 +31,48 @@ def usda(id: int) -> Callable[[], Tuple[str, Dict[Nutrient, float]]]:
 
             # print(name, value, f"'{(unit)}'")
 
-            if (
-                name.startswith("MUFA")
-                or name.startswith("SFA")
-                or name.startswith("PUFA")
-            ):
-                continue
-
             try:
-                nut = NAME_TO_ENUM[name]
+                converted = convert(name, value, unit)
             except KeyError:
                 print(name)
                 continue
 
-            if nut is None:
-                continue
+            if converted is not None:
+                ret[converted[0]] = converted[1]
 
-            if name == "Vitamin D (D2 + D3), International Units" and unit == "IU":
-                value *= VITAMIN_D_IU
-            else:
-                value = normalize(value, unit)
+        return food_name, ret
 
-            ret[nut] = value / 100  # Food on this website is per 100g
+    return Getter(inner, f"usda:{id}")
 
-        return food_name, ret
 
-    return inner
+# The nutrient and amount per g of a value of FDC, None for the nutrients we
+# do not track, KeyError for the names NAME_TO_ENUM does not know. Shared
+# with the bulk importer, see fdc.py.
+def convert(name: str, value: float, unit: str) -> Optional[Tuple[Nutrient, float]]:
+    if name.startswith("MUFA") or name.startswith("SFA") or name.startswith("PUFA"):
+        return None
+
+    nut = NAME_TO_ENUM[name]
+    if nut is None:
+        return None
+
+    if name == "Vitamin D (D2 + D3), International Units" and unit == "IU":
+        value *= VITAMIN_D_IU
+    else:
+        value = normalize(value, unit)
+
+    return nut, value / 100  # Food on this website is per 100g
 
 
 def convert_cooked_chicken_breast_to_uncoocked(
-    f: Callable[[], Tuple[str, Dict[Nutrient, float]]],
-) -> Callable[[], Tuple[str, Dict[Nutrient, float]]]:
+    f: Getter,
+) -> Getter:
     def inner():
         name, ret = f()
         # Dirty fix for chicken breast. We use cooked chicken breast because some nutrients of raw checken breast are missing.
         return name, {k: v / 1.49 for k, v in ret.items()}
 
-    return inner
+    return Getter(inner, f"{f.source} cooked")
 
 
 NAME_TO_ENUM = {
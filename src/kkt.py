@@ -0,0 +1,99 @@
+import cvxopt
+import numpy as np
+
+# https://cvxopt.org/userguide/coneprog.html#exploiting-structure
+#
+# The recipe QP has the structure
+#
+#     P = U^T U + diag(penalty)
+#     G = [-I; I; R]
+#
+# where U (s x n) are the weighted soft nutrient rows, R (k x n) the hard
+# nutrient rows and -I, I the food bounds. s and k are bounded by the number
+# of nutrients, n is the number of foods. Neither P nor the bound blocks of G
+# are ever stored densely, and the KKT system is reduced to
+#
+#     (diag(delta) + V^T V) ux = rhs,    V = [U; R / d_R]
+#
+# which is solved with the Woodbury identity in O(n (s + k)^2). The hard rows
+# R are expected to be equilibrated, see RecipeSolver._assemble.
+
+
+# Foods whose diagonal is FREE_RATIO times smaller than their share of V^T V
+# are eliminated densely, see kktsolver below.
+FREE_RATIO = 1e4
+
+
+def box_operators(U: np.ndarray, penalty: np.ndarray, R: np.ndarray):
+    n = U.shape[1]
+    k = R.shape[0]
+
+    rows, cols = np.nonzero(R)
+    G = cvxopt.spmatrix(
+        np.concatenate([-np.ones(n), np.ones(n), R[rows, cols]]),
+        np.concatenate([np.arange(n), np.arange(n, 2 * n), 2 * n + rows]),
+        np.concatenate([np.arange(n), np.arange(n), cols]),
+        (2 * n + k, n),
+    )
+
+    def P(x, y, alpha=1.0, beta=0.0):
+        xv = np.asarray(x)[:, 0]
+        yv = np.asarray(y)[:, 0]
+        yv *= beta
+        yv += alpha * (U.T @ (U @ xv) + penalty * xv)
+
+    def kktsolver(W):
+        d = np.asarray(W["d"])[:, 0]
+        d2 = d * d
+        delta = penalty + 1 / d2[:n] + 1 / d2[n : 2 * n]
+        V = np.concatenate([U, R / d[2 * n :, None]])
+
+        # Woodbury is only stable where delta dominates V^T V. The few foods
+        # strictly inside their bounds without a usage penalty (F) are solved
+        # through a dense |F| x |F| Schur complement instead:
+        #
+        #     C = I + V_B diag(delta_B)^{-1} V_B^T
+        #     S_BB^{-1} = diag(delta_B)^{-1} - diag(delta_B)^{-1} V_B^T C^{-1} V_B diag(delta_B)^{-1}
+        #     Sigma = diag(delta_F) + V_F^T C^{-1} V_F
+        F = delta * FREE_RATIO < np.einsum("ij,ij->j", V, V)
+        B = ~F
+        VB, VF = V[:, B], V[:, F]
+        deltaB = delta[B]
+        C = np.eye(len(V)) + (VB / deltaB) @ VB.T
+        Sigma = np.diag(delta[F]) + VF.T @ np.linalg.solve(C, VF)
+
+        def solve_bb(b):
+            t = b / deltaB
+            return t - (VB / deltaB).T @ np.linalg.solve(C, VB @ t)
+
+        def woodbury(b):
+            u = np.empty(n)
+            wb = solve_bb(b[B])
+            u[F] = np.linalg.solve(Sigma, b[F] - VF.T @ (VB @ wb))
+            u[B] = solve_bb(b[B] - VB.T @ (VF @ u[F]))
+            return u
+
+        # Solves
+        #
+        #     [ P   G'*W^{-1} ] [ ux   ]   [ bx ]
+        #     [ G   -W        ] [ W*uz ] = [ bz ]
+        #
+        # and returns ux, W*uz in x, z.
+        def solve(x, y, z):
+            xv = np.asarray(x)[:, 0]
+            zv = np.asarray(z)[:, 0]
+
+            bz = zv / d2
+            rhs = xv - bz[:n] + bz[n : 2 * n] + R.T @ bz[2 * n :]
+            ux = woodbury(rhs)
+            # One step of iterative refinement
+            ux += woodbury(rhs - delta * ux - V.T @ (V @ ux))
+
+            zv[:n] = (-ux - zv[:n]) / d[:n]
+            zv[n : 2 * n] = (ux - zv[n : 2 * n]) / d[n : 2 * n]
+            zv[2 * n :] = (R @ ux - zv[2 * n :]) / d[2 * n :]
+            xv[:] = ux
+
+        return solve
+
+    return P, G, kktsolver
@@ -1,5 +1,7 @@
 from enum import Enum, unique
-from typing import DefaultDict, Dict
+from typing import DefaultDict, Mapping
+
+import numpy as np
 
 
 @unique
@@ -45,3 +47,15 @@ class Nutrient(Enum):
 
 
 Nutrients = DefaultDict[Nutrient, float]
+
+
+# Column order of the dense foods × nutrients matrices used by the solver.
+NUTRIENTS = list(Nutrient)
+NUTRIENT_INDEX = {n: i for i, n in enumerate(NUTRIENTS)}
+
+
+def to_vector(nuts: Mapping[Nutrient, float]) -> np.ndarray:
+    vec = np.zeros(len(NUTRIENTS))
+    for n, v in nuts.items():
+        vec[NUTRIENT_INDEX[n]] = v
+    return vec
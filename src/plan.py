@@ -0,0 +1,304 @@
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import cvxopt
+import numpy as np
+
+from .catalog import CatalogFood
+from .food import Food, get_vector
+from .nutrient import NUTRIENT_INDEX, Nutrient
+from .recipe import NeedRequired, NeedSoftness, RecipeSolver
+
+# Of the KKT solves, relative to the right hand side
+REFINE_STEPS = 4
+REFINE_TOLERANCE = 1e-10
+
+
+class Coupling(NamedTuple):
+    days: List[int]
+    food: Optional[Food | CatalogFood]  # The total of food over days
+    nutrient: Optional[Nutrient]  # Or the average of nutrient over days
+    lb: Optional[float]
+    ub: Optional[float]
+
+
+# Plans one recipe per day over days, jointly. Every day is the QP of a
+# RecipeSolver with its own needs, and coupling rows tie the days together:
+# food totals, variety and nutrient averages over a range of days.
+#
+# The joint QP has the structure
+#
+#     P = diag(P_1 .. P_N)
+#     G = [-I; I; diag(R_1 .. R_N); C]
+#
+# so the KKT system is block diagonal plus the coupling rows C, and is
+# solved per day with the Woodbury identity, see _kktsolver. The N * f x
+# N * f matrix is never formed.
+class MealPlanner:
+    def __init__(self, days: int) -> None:
+        self.days = days
+        self.solvers = [RecipeSolver(sparse=True) for _ in range(days)]
+        self.coupling: List[Coupling] = []
+
+    def add_food(self, food: Food | CatalogFood, lb: float, ub: float, minimize_usage: bool = False):
+        vec = get_vector(food)
+        for p in self.solvers:
+            p.add_food_vector(food, vec, lb, ub, minimize_usage)
+
+    # The need of one day, on all days or the given ones
+    def add_need(
+        self,
+        nut: Nutrient,
+        lb: float,
+        ub: Optional[float],
+        required: NeedRequired,
+        hard: NeedSoftness,
+        days: Optional[Iterable[int]] = None,
+    ):
+        for d in range(self.days) if days is None else days:
+            self.solvers[d].add_need(nut, lb, ub, required, hard)
+
+    # The total of food over the days first..last, inclusive
+    def add_food_total(
+        self,
+        food: Food | CatalogFood,
+        lb: Optional[float],
+        ub: Optional[float],
+        first: int = 0,
+        last: Optional[int] = None,
+    ):
+        days = list(range(first, self.days if last is None else last + 1))
+        self.coupling.append(Coupling(days, food, None, lb, ub))
+
+    # Any window consecutive days get at most ub of food together, so that it
+    # is spread over the plan instead of served every day
+    def add_variety(self, food: Food | CatalogFood, window: int, ub: float):
+        for first in range(self.days - window + 1):
+            self.add_food_total(food, None, ub, first, first + window - 1)
+
+    # The average of nut over the days first..last, inclusive, while each
+    # single day is only held to its own needs
+    def add_nutrient_average(
+        self,
+        nut: Nutrient,
+        lb: Optional[float],
+        ub: Optional[float],
+        first: int = 0,
+        last: Optional[int] = None,
+    ):
+        days = list(range(first, self.days if last is None else last + 1))
+        self.coupling.append(Coupling(days, None, nut, lb, ub))
+
+    def solve(self) -> int:
+        q, G, h = self._assemble()
+        try:
+            self.sol = cvxopt.solvers.qp(
+                self._P,
+                q,
+                G,
+                h,
+                kktsolver=self._kktsolver,
+                options={"show_progress": False},
+            )
+        except ValueError:
+            # coneqp takes the square root of a negative scaling on some
+            # infeasible problems, instead of running out of iterations
+            self.sol = {"status": "unknown", "x": None}
+        return self.sol["status"] == "optimal"
+
+    # Whether the hard needs of every day and the coupling rows can be met
+    # at all, see RecipeSolver.feasible. The LP has the structure of the QP
+    # with P = 0, and is solved with the same KKT solver.
+    def feasible(self) -> bool:
+        q, G, h = self._assemble()
+        P, self.P = self.P, np.zeros_like(self.P)
+        try:
+            sol = cvxopt.solvers.lp(
+                cvxopt.matrix(0.0, q.size),
+                G,
+                h,
+                kktsolver=self._kktsolver,
+                options={"show_progress": False},
+            )
+        finally:
+            self.P = P
+        return sol["status"] != "primal infeasible"
+
+    def _assemble(self) -> Tuple[cvxopt.matrix, cvxopt.spmatrix, cvxopt.matrix]:
+        for p in self.solvers:
+            p._assemble()
+        self.food_names = self.solvers[0].food_names
+        N, f = self.days, len(self.food_names)
+        nf = N * f
+
+        self.P = np.stack([p.U.T @ p.U + np.diag(p.penalty) for p in self.solvers])
+        q = np.concatenate([p.q for p in self.solvers])
+        lb = np.concatenate([p.lb for p in self.solvers])
+        ub = np.concatenate([p.ub for p in self.solvers])
+        self.R = [p.R for p in self.solvers]
+        self.C, r_C = self._coupling_rows()
+        self.touch = [
+            np.flatnonzero(np.any(self.C[:, d * f : (d + 1) * f], axis=1)) for d in range(N)
+        ]
+
+        # G = [-I; I; diag(R_1 .. R_N); C] by its nonzeros
+        vals = [-np.ones(nf), np.ones(nf)]
+        rows = [np.arange(nf), np.arange(nf, 2 * nf)]
+        cols = [np.arange(nf), np.arange(nf)]
+        row = 2 * nf
+        for d, R in enumerate(self.R):
+            i, j = np.nonzero(R)
+            vals.append(R[i, j])
+            rows.append(row + i)
+            cols.append(d * f + j)
+            row += len(R)
+        i, j = np.nonzero(self.C)
+        vals.append(self.C[i, j])
+        rows.append(row + i)
+        cols.append(j)
+        G = cvxopt.spmatrix(
+            np.concatenate(vals), np.concatenate(rows), np.concatenate(cols), (row + len(self.C), nf)
+        )
+        h = np.concatenate([-lb, ub, *[p.h[2 * f :] for p in self.solvers], r_C])
+        return cvxopt.matrix(q), G, cvxopt.matrix(h)
+
+    # The coupling rows C x <= r, divided by their bound like RecipeSolver's
+    # hard nutrient rows
+    def _coupling_rows(self):
+        N, f = self.days, len(self.food_names)
+        matrix = self.solvers[0].matrix
+        rows, bounds = [], []
+        for c in self.coupling:
+            row = np.zeros((N, f))
+            if c.food is not None:
+                row[c.days, self.food_names.index(c.food)] = 1
+            elif c.nutrient is not None:
+                row[c.days] = matrix[:, NUTRIENT_INDEX[c.nutrient]] / len(c.days)
+            if c.lb is not None:
+                rows.append(-row.ravel())
+                bounds.append(-c.lb)
+            if c.ub is not None:
+                rows.append(row.ravel())
+                bounds.append(c.ub)
+
+        C = np.array(rows).reshape(len(rows), N * f)
+        r = np.array(bounds, dtype=np.float64)
+        scale = np.where(r != 0, np.abs(r), 1)
+        return C / scale[:, None], r / scale
+
+    def _P(self, x, y, alpha=1.0, beta=0.0):
+        xv = np.asarray(x)[:, 0].reshape(self.days, -1)
+        yv = np.asarray(y)[:, 0]
+        yv *= beta
+        yv += alpha * np.einsum("dij,dj->di", self.P, xv).ravel()
+
+    # Solves the KKT system of the joint QP. With D = W^{-2} split by the
+    # blocks of G, and w = D_C (C ux - z_C) the scaled step of the coupling
+    # rows, it reduces to
+    #
+    #     [ B   C^T        ] [ ux ]   [ rhs ]
+    #     [ C   -D_C^{-1}  ] [ w  ] = [ z_C ],   B = diag(P_d + D_l,d + D_u,d + R_d^T D_R,d R_d)
+    #
+    # B is inverted per day, in one batch, and w is solved for with
+    #
+    #     S w = C B^{-1} rhs - z_C,   S = D_C^{-1} + C Y,   Y = B^{-1} C^T
+    #     ux = B^{-1} rhs - Y w
+    #
+    # in O(N f^3 + N f^2 c + c^3) for c coupling rows. Keeping w apart
+    # instead of adding C^T D_C C to B matters once coupling rows are
+    # active: D_C grows past 1e14 and would swamp everything else.
+    def _kktsolver(self, W):
+        N = self.days
+        f = len(self.food_names)
+        nf = N * f
+        d = np.asarray(W["d"])[:, 0]
+        d2 = d * d
+
+        B = self.P.copy()
+        diag = (1 / d2[:nf] + 1 / d2[nf : 2 * nf]).reshape(N, f)
+        B[:, np.arange(f), np.arange(f)] += diag
+        row = 2 * nf
+        for k, R in enumerate(self.R):
+            B[k] += R.T @ (R / d2[row : row + len(R), None])
+            row += len(R)
+        dC = d[row:]
+        C = self.C
+        # The blocks are small and solved against many times, and one batched
+        # inverse is far cheaper than a solve per block per call.
+        # Iterative refinement below makes up for the accuracy.
+        Binv = np.linalg.inv(B)
+        # Most coupling rows only cover a few days, Y and S are summed over
+        # the rows touching each day
+        Y = []
+        S = cvxopt.matrix(np.diag(dC * dC))
+        Sv = np.asarray(S)
+        for k, touch in enumerate(self.touch):
+            Ck = C[touch, k * f : (k + 1) * f]
+            Y.append(Binv[k] @ Ck.T)
+            Sv[np.ix_(touch, touch)] += Ck @ Y[k]
+        # S is only semidefinite in floating point, factor it by LU
+        ipiv = cvxopt.matrix(0, (len(C), 1))
+        if len(C):
+            cvxopt.lapack.getrf(S, ipiv)
+
+        def inverse(b, c):
+            t = np.einsum("dij,dj->di", Binv, b.reshape(N, f))
+            w = cvxopt.matrix(C @ t.ravel() - c)
+            if len(C):
+                cvxopt.lapack.getrs(S, ipiv, w)
+            w = np.asarray(w)[:, 0]
+            for k, touch in enumerate(self.touch):
+                t[k] -= Y[k] @ w[touch]
+            return t.ravel(), w
+
+        def apply(u, w):
+            Bu = np.einsum("dij,dj->di", B, u.reshape(N, f)).ravel()
+            return Bu + C.T @ w, C @ u - dC * dC * w
+
+        def solve(x, y, z):
+            xv = np.asarray(x)[:, 0]
+            zv = np.asarray(z)[:, 0]
+
+            bz = zv / d2
+            rhs = xv - bz[:nf] + bz[nf : 2 * nf]
+            start = 2 * nf
+            for k, R in enumerate(self.R):
+                rhs[k * f : (k + 1) * f] += R.T @ bz[start : start + len(R)]
+                start += len(R)
+            zC = zv[row:]
+            ux, w = inverse(rhs, zC)
+            # Iterative refinement, one step is not always enough once
+            # coupling rows are active and S is nearly singular
+            scale = max(np.abs(rhs).max(initial=0), np.abs(zC).max(initial=0))
+            for _ in range(REFINE_STEPS):
+                a, b = apply(ux, w)
+                r, rC = rhs - a, zC - b
+                if max(np.abs(r).max(initial=0), np.abs(rC).max(initial=0)) <= REFINE_TOLERANCE * scale:
+                    break
+                du, dw = inverse(r, rC)
+                ux += du
+                w += dw
+
+            zv[:nf] = (-ux - zv[:nf]) / d[:nf]
+            zv[nf : 2 * nf] = (ux - zv[nf : 2 * nf]) / d[nf : 2 * nf]
+            start = 2 * nf
+            for k, R in enumerate(self.R):
+                end = start + len(R)
+                zv[start:end] = (R @ ux[k * f : (k + 1) * f] - zv[start:end]) / d[start:end]
+                start = end
+            zv[row:] = dC * w
+            xv[:] = ux
+
+        return solve
+
+    def amount(self, day: int, food: Food | CatalogFood | int) -> float:
+        if not isinstance(food, int):
+            food = self.food_names.index(food)
+        return self.sol["x"][day * len(self.food_names) + food]
+
+    def print_plan(self):
+        for d in range(self.days):
+            print(f"Day {d + 1}:")
+            for i, f in enumerate(self.food_names):
+                amount = float(f"{self.amount(d, i):.2g}")
+                if round(amount, 1) > 0:
+                    print(f"  {f} = {amount:.1f}")
@@ -1,11 +1,19 @@
+import hashlib
+import os
+from heapq import heappop, heappush
+from itertools import count
 from enum import Enum, auto
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 import numpy as np
 import cvxopt
 
-from .units import MCG, MG, G
-from .food import Food, get_or_load
-from .nutrient import Nutrient, Nutrients
+from .report import Bound, NutritionReport, Sensitivity
+from .activeset import active_set_qp
+from .cache import SolutionCache
+from .catalog import CatalogFood
+from .food import UNITS, Food, get_vector
+from .kkt import box_operators
+from .nutrient import NUTRIENT_INDEX, NUTRIENTS, Nutrient, Nutrients, to_vector
 
 # https://cvxopt.org/userguide/coneprog.html#quadratic-programming
 
@@ -20,25 +28,121 @@ class NeedRequired(Enum):
     NOT_REQUIRED = auto()
 
 
+class Backend(Enum):
+    AUTO = auto()
+    CVXOPT = auto()
+    ACTIVE_SET = auto()
+
+
+# Problems with up to this many foods between distinct bounds are solved
+# with the active set backend when the backend is AUTO, past that the
+# interior point method takes fewer iterations. The backends agree on the
+# optimal objective, but when it has more than one optimal plan (singular
+# P, see activeset.REGULARIZE) they can return different amounts, so AUTO
+# answers of degenerate problems depend on their size. Pick a backend to
+# compare such plans.
+ACTIVE_SET_MAX_FOODS = 16
+
+
 class RecipeSolver:
-    food_limits: Dict[Food, Tuple[float, float]]
-    food_nutrients: Dict[Food, Nutrients]
-    food_minimize_usage: Dict[Food, bool]
-    food_names: List[Food]
+    # Solutions of problems, keyed by _key(). Shared
+    # by every solver, see cache.hits, cache.misses for how well it does
+    cache: SolutionCache = SolutionCache()
+
+    food_limits: Dict[Food | CatalogFood, Tuple[float, float]]
+    food_nutrients: Dict[Food | CatalogFood, Nutrients]  # Of the foods added by add_loaded_food
+    food_vectors: Dict[Food | CatalogFood, np.ndarray]
+    food_minimize_usage: Dict[Food | CatalogFood, bool]
+    food_units: Dict[Food | CatalogFood, float]
+    food_names: List[Food | CatalogFood]
     needs: Dict[Nutrient, Tuple[float, Optional[float], NeedRequired, NeedSoftness]]
+    assembled: bool
+    warm: Optional[Tuple[np.ndarray, np.ndarray]]  # x, z of the last optimal solve
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        sparse: bool = False,
+        day: float = 1,
+        discrete: bool = False,
+        gap: float = 1e-3,
+        backend: Backend = Backend.AUTO,
+        usage_weight: float = 0.1,
+    ) -> None:
+        # Keep the food bounds as a box and never form P, G densely, see kkt.py
+        self.sparse = sparse
+        self.backend = backend
+        # How many days the food limits and needs cover. The variables are
+        # the amounts per day and amount() scales back, while the objective
+        # is the one of the amounts over all days: with x = day * y,
+        #
+        #     1/2 x^T U_N^T U_N x + q^T x + 1/2 penalty x^2
+        #         = 1/2 y^T U^T U y + day q^T y + 1/2 day^2 penalty y^2
+        #
+        # as the soft needs are normalized by their mid, which scales with
+        # day too. It is not scale free, a N days plan is not N times the
+        # one day plan.
+        self.day = day
+        # Foods in UNITS only come in whole units, see _branch_and_bound
+        self.discrete = discrete
+        self.gap = gap
+        # The weight of the squared amount of the minimize_usage foods in the
+        # objective, against the soft needs, see sweep
+        self.usage_weight = usage_weight
+        self.max_nodes = 10000
+        self.food_units = {}
         self.food_limits = {}
         self.food_nutrients = {}
+        self.food_vectors = {}
         self.needs = {}
         self.food_names = []
         self.food_minimize_usage = {}
+        # Whether the arrays built by _assemble match the dicts above, the
+        # update_*/remove_food/add_food calls patch them in place when they can
+        self.assembled = False
+        self.warm = None
+
+    def add_food(
+        self,
+        food: Food | CatalogFood,
+        lb: float,
+        ub: float,
+        minimize_usage: bool = False,
+        unit: Optional[float] = None,
+    ):
+        if food not in self.food_vectors:
+            self.add_food_vector(food, get_vector(food), lb, ub, minimize_usage, unit)
+
+    def add_loaded_food(
+        self,
+        food: Food,
+        nuts: Nutrients,
+        lb: float,
+        ub: float,
+        minimize_usage: bool = False,
+        unit: Optional[float] = None,
+    ):
+        self.food_nutrients[food] = nuts
+        self.add_food_vector(food, to_vector(nuts), lb, ub, minimize_usage, unit)
 
-    def add_food(self, food: Food, lb: float, ub: float, minimize_usage: bool = False):
-        if food not in self.food_nutrients:
-            self.food_nutrients[food] = get_or_load(food)
-            self.food_limits[food] = (lb, ub)
-            self.food_minimize_usage[food] = minimize_usage
+    # vec over NUTRIENTS, e.g. a row of the catalog
+    def add_food_vector(
+        self,
+        food: Food | CatalogFood,
+        vec: np.ndarray,
+        lb: float,
+        ub: float,
+        minimize_usage: bool = False,
+        unit: Optional[float] = None,
+    ):
+        if unit is None and self.discrete:
+            unit = UNITS.get(food) if isinstance(food, Food) else None
+        self.food_vectors[food] = vec
+        self.food_limits[food] = (lb, ub)
+        self.food_minimize_usage[food] = minimize_usage
+        if unit is not None:
+            self.food_units[food] = unit
+        if self.assembled:
+            self._append_food(food)
 
     def add_need(
         self,
@@ -52,102 +156,600 @@ class RecipeSolver:
             return
 
         self.needs[nut] = (lb, ub, required, hard)
+        self.assembled = False
 
-    def solve(self) -> int:
-        self.food_names = foods = list(self.food_limits.keys())
+    def update_food_limits(self, food: Food | CatalogFood, lb: float, ub: float):
+        if food not in self.food_vectors:
+            raise KeyError(f"{food} is not a food of this solver, see add_food")
+        self.food_limits[food] = (lb, ub)
+        if not self.assembled:
+            return
 
-        G = np.zeros((len(foods) * 2, len(foods)))
-        h = np.zeros(len(foods) * 2)
+        n = len(self.food_names)
+        j = self.food_names.index(food)
+        lb, ub = lb / self.day, ub / self.day
+        self.lb[j], self.ub[j] = lb, ub
+        self.h[j], self.h[n + j] = -lb, ub
 
-        for i, food in enumerate(foods):
-            lb, ub = self.food_limits[food]
-            # The food should be bigger then lb, aka -food <= -lb
-            G[i, i] = -1
-            h[i] = -lb
+    def update_need(
+        self,
+        nut: Nutrient,
+        lb: float,
+        ub: Optional[float],
+        required: NeedRequired,
+        hard: NeedSoftness,
+    ):
+        old = self.needs.get(nut)
+        self.needs[nut] = (lb, ub, required, hard)
+        if not self.assembled:
+            return
+        if old is None or old[2:] != (required, hard) or (old[1] is None) != (ub is None):
+            # The need moves between row blocks, rows appear or disappear
+            self.assembled = False
+            return
 
-            # The food should be less then ub, aka food <= ub
-            G[i + len(foods), i] = 1
-            h[i + len(foods)] = ub
+        k = NUTRIENT_INDEX[nut]
+        lb, ub = lb / self.day, None if ub is None else ub / self.day
+        self.need_lb[k] = lb
+        self.need_ub[k] = np.inf if ub is None else ub
+        n = len(self.food_names)
+        col = self.matrix[:, k]
+
+        rows = []
+        if self.rows_lb[k]:
+            rows.append((np.count_nonzero(self.rows_lb[:k]), -col, -lb))
+        if self.rows_ub[k]:
+            i = np.count_nonzero(self.rows_lb) + np.count_nonzero(self.rows_ub[:k])
+            rows.append((i, col, ub))
+        for i, row, bound in rows:
+            self.row_scale[i] = abs(bound) if bound != 0 else 1
+            self.R[i] = row / self.row_scale[i]
+            self.h[2 * n + i] = bound / self.row_scale[i]
+            if not self.sparse:
+                self.G[2 * n + i] = self.R[i]
+
+        if self.rows_soft[k]:
+            i = np.count_nonzero(self.rows_soft[:k])
+            old_u = self.U[i].copy()
+            self.mid[k] = self._mid(lb, ub)
+            self.U[i] = np.sqrt(2) / abs(self.mid[k]) * col
+            if not self.sparse:
+                self.P += np.outer(self.U[i], self.U[i]) - np.outer(old_u, old_u)
+
+    def update_usage_weight(self, usage_weight: float):
+        old, self.usage_weight = self.usage_weight, usage_weight
+        if not self.assembled:
+            return
 
-        P = np.zeros((len(foods), len(foods)))
-        q = np.zeros((1, len(foods)))
+        self.penalty = usage_weight * self.minimize * self.day**2
+        if not self.sparse:
+            n = len(self.food_names)
+            self.P[np.arange(n), np.arange(n)] += (usage_weight - old) * self.minimize * self.day**2
+
+    # Spread the foods and needs over another number of days. Their totals
+    # stay what they were until update_food_limits and update_need change
+    # them, and the last solution stays as a warm start.
+    def update_day(self, day: float):
+        self.day = day
+        if self.assembled:
+            self._assemble()
+
+    def remove_food(self, food: Food | CatalogFood):
+        if food not in self.food_vectors:
+            return
+
+        self.food_nutrients.pop(food, None)
+        del self.food_vectors[food]
+        del self.food_limits[food]
+        del self.food_minimize_usage[food]
+        self.food_units.pop(food, None)
+        if not self.assembled:
+            return
 
+        n = len(self.food_names)
+        j = self.food_names.index(food)
+        self.food_names.pop(j)
+        self.matrix = np.delete(self.matrix, j, axis=0)
+        self.lb = np.delete(self.lb, j)
+        self.ub = np.delete(self.ub, j)
+        self.minimize = np.delete(self.minimize, j)
+        self.unit = np.delete(self.unit, j)
+        self.penalty = np.delete(self.penalty, j)
+        self.q = np.delete(self.q, j)
+        self.U = np.delete(self.U, j, axis=1)
+        self.R = np.delete(self.R, j, axis=1)
+        self.h = np.delete(self.h, [j, n + j])
+        if not self.sparse:
+            self.P = np.delete(np.delete(self.P, j, axis=0), j, axis=1)
+            self.G = np.delete(np.delete(self.G, [j, n + j], axis=0), j, axis=1)
+        if self.warm is not None:
+            x, z = self.warm
+            self.warm = np.delete(x, j), np.delete(z, [j, n + j])
+
+    def _append_food(self, food: Food | CatalogFood):
+        n = len(self.food_names)
+        lb, ub = (v / self.day for v in self.food_limits[food])
+        vec = self.food_vectors[food]
+        penalty = self.usage_weight * self.food_minimize_usage[food] * self.day**2
+
+        u = np.sqrt(2) / np.abs(self.mid[self.rows_soft]) * vec[self.rows_soft]
+        r = np.concatenate([-vec[self.rows_lb], vec[self.rows_ub]]) / self.row_scale
+
+        self.food_names.append(food)
+        self.matrix = np.vstack([self.matrix, vec])
+        self.lb = np.append(self.lb, lb)
+        self.ub = np.append(self.ub, ub)
+        self.minimize = np.append(self.minimize, self.food_minimize_usage[food])
+        self.unit = np.append(self.unit, self.food_units.get(food, 0) / self.day)
+        self.penalty = np.append(self.penalty, penalty)
+        self.q = np.append(self.q, -2 * vec[self.rows_soft].sum() * self.day)
+        if not self.sparse:
+            p = self.U.T @ u
+            self.P = np.block([[self.P, p[:, None]], [p[None, :], u @ u + penalty]])
+            G = np.insert(self.G, [n, 2 * n], 0, axis=0)
+            self.G = np.asfortranarray(np.hstack([G, np.zeros((len(G), 1))]))
+            self.G[n, n] = -1
+            self.G[2 * n + 1, n] = 1
+            self.G[2 * n + 2 :, n] = r
+        self.U = np.hstack([self.U, u[:, None]])
+        self.R = np.hstack([self.R, r[:, None]])
+        self.h = np.insert(self.h, [n, 2 * n], [-lb, ub])
+        if self.warm is not None:
+            x, z = self.warm
+            self.warm = np.append(x, (lb + ub) / 2), np.insert(z, [n, 2 * n], 1)
+
+    def solve(self) -> int:
+        self._assemble()
+
+        # Only the same problem again, the objective has no scaling
+        # symmetry for problems over other days to share a solution
+        key = self._key()
+        sol = self.cache.get(key)
+        if sol is not None:
+            self.sol = sol
+            return self._solved()
+
+        optimal = self._optimize()
+        self.cache.put(key, self.sol)
+        return optimal
+
+    # Hash of the assembled problem and the options its solution depends on
+    def _key(self) -> bytes:
+        digest = hashlib.sha1(f"{self.sparse} {self.backend.name} {self.gap} {self.usage_weight!r} {self.day!r}".encode())
+        for a in (
+            self.matrix, self.lb, self.ub, self.minimize, self.unit,
+            self.need_lb, self.need_ub, self.required, self.soft,
+        ):
+            if a.dtype == np.float64:
+                # x * day / day is not always x, ignore the last few bits
+                m, e = np.frexp(a)
+                a = np.stack([np.round(m, 12), e])
+            digest.update(np.ascontiguousarray(a).tobytes())
+        return digest.digest()
+
+    # Solve the foods of this solver against many needs, e.g. one dog() per
+    # dog, in a process pool. The food matrix is assembled once and inherited
+    # read-only by the workers. Results are yielded in the order of profiles,
+    # a failing profile yields a BatchResult with its error instead of
+    # aborting the batch.
+    def solve_many(
+        self,
+        profiles: Iterable[
+            Dict[Nutrient, Tuple[float, Optional[float], NeedRequired, NeedSoftness]]
+        ],
+        workers: Optional[int] = None,
+    ) -> Iterator["BatchResult"]:
+        self._assemble_foods()
+        profiles = list(profiles)
+        foods = (
+            self.sparse, self.day, self.backend, self.usage_weight, self.food_names,
+            self.matrix, self.lb, self.ub, self.minimize, self.unit,
+        )
+        workers = workers or os.cpu_count() or 1
+
+        if workers == 1:
+            _init_batch(*foods)
+            yield from map(_solve_one, profiles)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunksize = max(1, len(profiles) // (workers * 4))
+        with ProcessPoolExecutor(workers, initializer=_init_batch, initargs=foods) as pool:
+            yield from pool.map(_solve_one, profiles, chunksize=chunksize)
+
+    # Solve again after update_food_limits, update_need, add_food or
+    # remove_food, reusing the assembled problem and warm starting from the
+    # last optimal solution.
+    def resolve(self) -> int:
+        if self.warm is None or not self.assembled:
+            # A primal-only start is worse than the default one
+            return self.solve()
+
+        key = self._key()
+        sol = self.cache.get(key)
+        if sol is not None:
+            self.sol = sol
+            return self._solved()
+
+        optimal = self._optimize(warm=True)
+        self.cache.put(key, self.sol, persist=False)
+        return optimal
+
+    # How the soft needs trade against the usage of the minimize_usage
+    # foods, solved at each usage weight in turn. Every solve is warm started
+    # from the one before, so weights in order are each a step or two away.
+    def sweep(self, weights: Iterable[float]) -> List["FrontierPoint"]:
+        points = []
+        for weight in weights:
+            self.update_usage_weight(weight)
+            if not self.resolve():
+                points.append(FrontierPoint(weight, self.sol["status"], None, None, None, 0))
+                continue
+
+            x = np.array(self.sol["x"]).ravel()
+            u = self.U @ x
+            points.append(
+                FrontierPoint(
+                    weight,
+                    "optimal",
+                    float(0.5 * u @ u + self.q @ x),
+                    float(x[self.minimize].sum() * self.day),
+                    x * self.day,
+                    self.sol.get("iterations", 0),
+                )
+            )
+        return points
+
+    def _optimize(self, warm: bool = False) -> int:
+        if self.unit.any():
+            return self._branch_and_bound()
+        return self._warm_qp() if warm else self._qp()
+
+    def _warm_qp(self) -> int:
+        if self.warm is None:
+            return self._qp()
+
+        x, z = self.warm
+        if self._backend() == Backend.ACTIVE_SET:
+            # The rows that were active, z is exactly 0 on the others unless
+            # it came from the interior point method
+            return self._qp(active=np.flatnonzero(z > 1e-8 * z.max(initial=0)))
+        # The interior point method needs s, z strictly inside the cone
+        s = self.h - self._G(x)
+        eps = 1e-6 * max(1.0, float(np.abs(self.h).max(initial=0)))
+        return self._qp(
+            {
+                "x": cvxopt.matrix(x),
+                "s": cvxopt.matrix(np.maximum(s, eps)),
+                "z": cvxopt.matrix(np.maximum(z, 1e-6)),
+            }
+        )
+
+    # Branch and bound over the QP relaxation for the foods with a unit.
+    # Nodes are taken best bound first and warm started from their parent,
+    # until no open node can improve the best integral plan by more than gap.
+    # Integral plans are polished with the units fixed, so the hard
+    # constraints hold for the exact amounts.
+    def _branch_and_bound(self) -> int:
+        n = len(self.food_names)
+        d = np.flatnonzero(self.unit)
+        unit = self.unit[d]
+        lb, ub, h = self.lb.copy(), self.ub.copy(), self.h.copy()
+
+        def relax(lo: np.ndarray, hi: np.ndarray) -> int:
+            self.lb[d], self.ub[d] = lo * unit, hi * unit
+            self.h[d], self.h[n + d] = -self.lb[d], self.ub[d]
+            return self._warm_qp()
+
+        best, best_sol, best_warm = np.inf, None, None
+
+        # Nodes bounded above this can not improve on best by more than gap.
+        # The objective can be negative, the gap is relative to its size.
+        def cutoff() -> float:
+            return best - self.gap * abs(best) if best < np.inf else np.inf
+        counter = count()
+        heap = [
+            (
+                -np.inf,
+                next(counter),
+                np.ceil(lb[d] / unit - 1e-9),
+                np.floor(ub[d] / unit + 1e-9),
+                self.warm,
+            )
+        ]
+        self.nodes = 0
+        while heap and self.nodes < self.max_nodes:
+            bound, _, lo, hi, self.warm = heappop(heap)
+            if bound >= cutoff():
+                break
+            self.nodes += 1
+            if (lo > hi).any() or not relax(lo, hi):
+                continue
+            obj = self.sol["primal objective"]
+            if obj >= cutoff():
+                continue
+
+            k = np.array(self.sol["x"]).ravel()[d] / unit
+            frac = np.abs(k - np.round(k))
+            if frac.max() > 1e-6:
+                i = np.argmax(frac)
+                down, up = hi.copy(), lo.copy()
+                down[i], up[i] = np.floor(k[i]), np.ceil(k[i])
+                heappush(heap, (obj, next(counter), lo, down, self.warm))
+                heappush(heap, (obj, next(counter), up, hi, self.warm))
+                continue
+
+            k = np.round(k)
+            if relax(k, k) and self.sol["primal objective"] < best:
+                best = self.sol["primal objective"]
+                best_sol, best_warm = dict(self.sol), self.warm
+                best_sol["x"] = x = cvxopt.matrix(self.sol["x"])
+                np.asarray(x)[d, 0] = k * unit
+
+        self.lb, self.ub, self.h = lb, ub, h
+        if best_sol is None:
+            self.sol = {"status": "unknown" if heap else "infeasible", "x": None}
+            self.warm = None
+            return False
+        self.sol = best_sol
+        self.warm = best_warm
+        return True
+
+    # Whether the hard constraints can be met at all. coneqp has no
+    # infeasibility certificate and runs to maxiters on infeasible problems,
+    # the LP detects them in a few iterations.
+    def feasible(self) -> bool:
+        if not self.assembled:
+            self._assemble()
+        if self.sparse:
+            G = box_operators(self.U, self.penalty, self.R)[1]
+        else:
+            G = cvxopt.matrix(self.G)
+
+        sol = cvxopt.solvers.lp(
+            cvxopt.matrix(0.0, (len(self.q), 1)),
+            G,
+            cvxopt.matrix(self.h),
+            options={"show_progress": False},
+        )
+        return sol["status"] != "primal infeasible"
+
+    def _G(self, x: np.ndarray) -> np.ndarray:
+        return np.concatenate([-x, x, self.R @ x])
+
+    def _backend(self) -> Backend:
+        if self.backend != Backend.AUTO:
+            return self.backend
+        if not self.sparse and np.count_nonzero(self.lb < self.ub) <= ACTIVE_SET_MAX_FOODS:
+            return Backend.ACTIVE_SET
+        return Backend.CVXOPT
+
+    def _qp(self, initvals=None, active: Optional[np.ndarray] = None) -> int:
+        if self._backend() == Backend.ACTIVE_SET:
+            n = len(self.q)
+            P = self.P if not self.sparse else self.U.T @ self.U + np.diag(self.penalty)
+            self.sol = active_set_qp(P, self.q, self.lb, self.ub, self.R, self.h[2 * n :], active)
+            return self._solved()
+
+        if self.sparse:
+            P, G, kktsolver = box_operators(self.U, self.penalty, self.R)
+        else:
+            P, G, kktsolver = cvxopt.matrix(self.P), cvxopt.matrix(self.G), None
+
+        self.sol = cvxopt.solvers.qp(
+            P,
+            cvxopt.matrix(self.q),
+            G,
+            cvxopt.matrix(self.h),
+            kktsolver=kktsolver,
+            initvals=initvals,
+            options={"show_progress": False},
+        )
+
+        return self._solved()
+
+    def _solved(self) -> int:
+        optimal = self.sol["status"] == "optimal"
+        self.warm = (
+            (np.array(self.sol["x"]).ravel(), np.array(self.sol["z"]).ravel())
+            if optimal
+            else None
+        )
+
+        return optimal
+
+    @staticmethod
+    def _mid(lb: float, ub: Optional[float]) -> float:
+        return lb * 1.05 if ub is None else (lb + ub) / 2
+
+    def _assemble(self):
+        self._assemble_foods()
+        self._assemble_needs()
+
+    def _assemble_foods(self):
+        self.food_names = foods = list(self.food_limits.keys())
+        n = len(foods)
+
+        # M_{jk}: how much nutrient k the food j contains
+        self.matrix = np.array(
+            [self.food_vectors[food] for food in foods], dtype=np.float64
+        ).reshape(n, len(NUTRIENTS))
+        # Everything below is per day
+        self.lb = np.array([self.food_limits[food][0] for food in foods], dtype=np.float64) / self.day
+        self.ub = np.array([self.food_limits[food][1] for food in foods], dtype=np.float64) / self.day
+        self.minimize = np.array([self.food_minimize_usage[food] for food in foods], dtype=bool)
+        # 0 for foods that can be cut to any amount
+        self.unit = np.array([self.food_units.get(food, 0) for food in foods], dtype=np.float64) / self.day
+
+    def _assemble_needs(self):
+        n = len(self.food_names)
+        M = self.matrix
+
+        self.need_lb = np.zeros(len(NUTRIENTS))
+        self.need_ub = np.full(len(NUTRIENTS), np.inf)
+        self.mid = np.ones(len(NUTRIENTS))
+        self.required = np.zeros(len(NUTRIENTS), dtype=bool)
+        self.soft = np.zeros(len(NUTRIENTS), dtype=bool)
+        for need, (lb, ub, required, hard) in self.needs.items():
+            k = NUTRIENT_INDEX[need]
+            lb, ub = lb / self.day, None if ub is None else ub / self.day
+            self.need_lb[k] = lb
+            if ub is not None:
+                self.need_ub[k] = ub
+            self.mid[k] = self._mid(lb, ub)
+            self.required[k] = required == NeedRequired.REQUIRED
+            self.soft[k] = hard == NeedSoftness.SOFT
+
+        self.rows_lb = hard_lb = self.required & ~self.soft
+        self.rows_ub = hard_ub = hard_lb & np.isfinite(self.need_ub)
+        self.rows_soft = soft = self.required & self.soft
         # In QP's form minimize \frac12 x^TPx + q^Tx
         #            subject to Gx <= h
         #                       Ax = b
         #
+        # G stacks, in this order:
+        #   -I     x <= -lb        the food should be bigger then lb
+        #    I     x <= ub         the food should be less then ub
+        #   -H_lb  x <= -need_lb   the nutrient should be bigger then lb
+        #    H_ub  x <= need_ub    the nutrient should be less then ub
+        #
+        # The nutrient rows are divided by their bound, energy in J and
+        # vitamins in g are many orders of magnitude apart otherwise.
+        bound = np.concatenate([self.need_lb[hard_lb], self.need_ub[hard_ub]])
+        self.row_scale = np.where(bound != 0, np.abs(bound), 1)
+        self.R = np.concatenate([-M[:, hard_lb].T, M[:, hard_ub].T]) / self.row_scale[:, None]
+        self.h = np.concatenate(
+            [-self.lb, self.ub, np.concatenate([-self.need_lb[hard_lb], self.need_ub[hard_ub]]) / self.row_scale]
+        )
+
         # total f types of food, n types of nutrient
         # x_j: amount of food j, m_i: mid of lb and ub nutrient i
         #
         # H_{ij} the food j contains how much nutrient i
         # Minimize \sum_{i=0..n} (\sum_{j=0..f} H_{ij}x_j - m_i)^2
-        # i.e. Minimize \sum_{i=0..n} (\sum_{j=0..f,k=0..f} H_{ij}x_jH_{ik}x_k - 2 m_i \sum_{j=0..f}H_{ij}x_j + m_i^2)
-        #
-        # let P = \sum_{i=0..n} P_i
-        # let q = \sum_{i=0..n} q_i
-        #
-        # i.e. P_i = 2 H_i^T H_i
-        #      q_i = - 2 m_i H_i
         #
         # Normalized:
         # Minimize (\sum_{j=0..f} \frac{H_{ij}}{m_i}x_j - 1)^2
         # i.e. Minimize \sum_{j=0..f,k=0..f} \frac{H_{ij}H_{ik}}{m_i^2}x_jx_k - 2 \sum_{j=0}^{f}H_{ij}x_j + 1
         # i.e. P_i = 2 \frac{H_i^T H_i}{m_i^2}
         #      q_i = - 2 H_i
-        for need, (lb, ub, required, hard) in self.needs.items():
-            # if isinstance(self.provides[n], int) and self.provides[n] == 0:
-            #     logging.info(f"WARN: Food lacks {n}")
-            #     continue
-            if required != NeedRequired.REQUIRED:
-                continue
+        #
+        # Summed over all soft needs at once, with W = diag(1 / m^2):
+        #      P = 2 H^T W H = U^T U, U = \sqrt{2W} H
+        #      q = - 2 H^T 1
+        #
+        # over all days, in the per day amounts see self.day
+        mid = self.mid[soft]
+        H = M[:, soft]
+        self.U = np.sqrt(2 / (mid * mid))[:, None] * H.T
+        self.penalty = self.usage_weight * self.minimize * self.day**2
+        self.q = -2 * H.sum(axis=1) * self.day
+
+        self.assembled = True
+        if self.sparse:
+            # Box mode: see kkt.py, P and G are never formed densely
+            return
+
+        P = np.asfortranarray(self.U.T @ self.U)
+        P[np.arange(n), np.arange(n)] += self.penalty
+        self.P = P
 
-            H = np.asarray([self.food_nutrients[food][need] for food in foods])
-
-            if hard == NeedSoftness.HARD:
-                # The nutrient should be bigger then lb, aka -has <= -lb
-                G = np.vstack([G, -H])
-                h = np.append(h, -lb)
-                if ub is not None:
-                # The nutrient should be less then ub
-                    G = np.vstack([G, H])
-                    h = np.append(h, ub)
-            else:
-                if ub is None:
-                    mid = lb * 1.05
-                else:
-                    mid = (lb + ub) / 2
-
-                H = H[None, :]
-                P += 2 * H.T @ H / mid / mid
-                q += -2 * H
-                # P += H.T @ H
-                # q += H * -mid
-
-        for i, food in enumerate(foods):
-            if self.food_minimize_usage[food]:
-                P[i, i] += 0.1
-            
-        G = cvxopt.matrix(G)
-        h = cvxopt.matrix(h)
-        P = cvxopt.matrix(P.T)
-        q = cvxopt.matrix(q.T)
-
-        self.sol = cvxopt.solvers.qp(P, q, G, h, options={"show_progress": False})
-
-        return self.sol["status"] == "optimal"
+        G = np.zeros((2 * n + len(self.R), n), order="F")
+        G[np.arange(n), np.arange(n)] = -1
+        G[np.arange(n, 2 * n), np.arange(n)] = 1
+        G[2 * n :] = self.R
+        self.G = G
 
     def print_foods(self):
         print("Solution:")
 
         for i, f in enumerate(self.food_names):
+            if f in self.food_units:
+                count = round(self.amount(i) / self.food_units[f])
+                print(f"  {f} = {count} x {self.food_units[f]:g}")
+                continue
             amount = float(f"{self.amount(i):.2g}")
             print(f"  {f} = {amount:.1f}")
 
-    def amount(self, food: Food | int):
-        if isinstance(food, Food):
+    def amount(self, food: Food | CatalogFood | int):
+        if not isinstance(food, int):
             food = self.food_names.index(food)
 
-        return self.sol["x"][food]
+        return self.sol["x"][food] * self.day
+
+    def report(
+        self,
+        needs: Dict[
+            Nutrient, Tuple[float, Optional[float], NeedRequired, NeedSoftness]
+        ],
+        day: int = 1,
+    ) -> NutritionReport:
+        nutrients = [n for n in NUTRIENTS if n in needs]
+        cols = [NUTRIENT_INDEX[n] for n in nutrients]
+        amounts = np.array(self.sol["x"]).ravel() * self.day
+        contributions = self.matrix[:, cols].T * (amounts / day)
+
+        lb = np.array([needs[n][0] for n in nutrients], dtype=np.float64) / day
+        ub = np.array([needs[n][1] or np.inf for n in nutrients], dtype=np.float64) / day
+        totals = contributions.sum(axis=1)
+        return NutritionReport(
+            day,
+            self.food_names,
+            nutrients,
+            amounts,
+            contributions,
+            totals,
+            lb,
+            ub,
+            np.array([needs[n][2] == NeedRequired.REQUIRED for n in nutrients], dtype=bool),
+            # Within the tolerance of the solvers, hard needs are often met
+            # at their bound exactly
+            (totals >= lb - 1e-6 * np.abs(lb)) & (totals <= ub + 1e-6 * np.abs(ub)),
+        )
+
+    # What each row of G bounds, and the factor from the row to the units of
+    # add_food/add_need over all days
+    def _rows(self) -> Tuple[List[Food | Nutrient], List[Bound], np.ndarray]:
+        n = len(self.food_names)
+        nutrients = [NUTRIENTS[k] for k in np.flatnonzero(self.rows_lb)]
+        nutrients += [NUTRIENTS[k] for k in np.flatnonzero(self.rows_ub)]
+        subjects = [*self.food_names, *self.food_names, *nutrients]
+        kinds = [Bound.LOWER] * n + [Bound.UPPER] * n
+        kinds += [Bound.LOWER] * np.count_nonzero(self.rows_lb)
+        kinds += [Bound.UPPER] * np.count_nonzero(self.rows_ub)
+        scale = np.concatenate([np.ones(2 * n), self.row_scale]) * self.day
+        return subjects, kinds, scale
+
+    # Every food bound and hard need with its slack and shadow price, from
+    # the multipliers z of the last solve. Rows of G are per day and the
+    # nutrient ones divided by row_scale, both are undone here.
+    #
+    # A food with lb == ub is one equality row. Its two bound rows are both
+    # active and only the difference of their multipliers is determined,
+    # cvxopt e.g. returns two large prices of opposite sign, so they are
+    # reported as their sum.
+    def sensitivity(self) -> List[Sensitivity]:
+        x = np.array(self.sol["x"]).ravel()
+        z = np.array(self.sol["z"]).ravel()
+        slack = self.h - self._G(x)
+        # Relative to the food's range, nutrient rows are relative already
+        active = slack <= 1e-6 * np.concatenate([np.maximum(self.ub, 1), np.maximum(self.ub, 1), np.ones(len(self.R))])
+        subjects, kinds, scale = self._rows()
+        bounds = np.abs(self.h) * scale
+        slack *= scale
+        price = np.where([k == Bound.LOWER for k in kinds], z, -z) / scale
+
+        n = len(self.food_names)
+        fixed = self.ub - self.lb <= 1e-12 * np.maximum(1, np.abs(self.ub))
+        rows = []
+        for i, (subject, kind) in enumerate(zip(subjects, kinds)):
+            if i < 2 * n and fixed[i % n]:
+                if i < n:
+                    rows.append(Sensitivity(subject, Bound.EQUAL, float(bounds[i]), 0.0, float(price[i] + price[i + n]) + 0.0, True))
+                continue
+            rows.append(Sensitivity(subject, kind, float(bounds[i]), float(slack[i]), float(price[i]) + 0.0, bool(active[i])))
+        return rows
 
     def print_nutrition(
         self,
@@ -157,82 +759,50 @@ class RecipeSolver:
         day: int = 1,
         detail: bool = False,
     ):
-        print("Nutrition:")
-        for n in Nutrient:
-            if n not in needs:
-                continue
-
-            lb, ub, required, _ = needs[n]
-            ub = ub or float("+INF")
-
-            value = 0
-            comp = []
-            for i, f in enumerate(self.food_names):
-                nut = self.food_nutrients[f].get(n, 0)
-                if nut != 0:
-                    comp.append((f, self.amount(i) * nut))
-                value += self.amount(i) * nut
-            lb /= day
-            ub /= day
-            value /= day
-
-            if n == Nutrient.ENERGY:
-                scale = 1000
-                unit = "kJ"
-            else:
-                if lb >= G:
-                    scale = G
-                    unit = "g"
-                elif lb >= MG:
-                    scale = MG
-                    unit = "mg"
-                else:
-                    scale = MCG
-                    unit = "μg"
-
-            value /= scale
-            lb /= scale
-            ub /= scale
-
-            valid = lb <= value <= ub
-
-            if detail:
-                comp_str = " = " + " + ".join(
-                    [f"{f.name} {v / scale:g} {unit}" for f, v in comp if v != 0]
-                )
-            else:
-                comp_str = ""
-
-            if len(comp) != 1 or not detail:
-                comp_str += f" = {value:g} {unit}"
-
-            color = ""
-            if required != NeedRequired.REQUIRED:
-                if not valid:
-                    color = BColors.LIGHT_YELLOW
-                else:
-                    color = BColors.GRAY
-            elif not valid:
-                color = BColors.RED
-            else:
-                color = BColors.LIGHT_GREEN
-
-            print(
-                f"{color}  {n}{comp_str}, valid: {lb:.2f} ~ {ub:.2f} {unit}{BColors.ENDC}"
-            )
-
-
-class BColors:
-    HEADER = "\033[95m"
-    RED = "\033[31m"
-    YELLOW = "\033[33m"
-    GRAY = "\033[37m"
-    OKBLUE = "\033[94m"
-    OKCYAN = "\033[96m"
-    GREEN = "\033[32m"
-    LIGHT_GREEN = "\033[92m"
-    LIGHT_YELLOW = "\033[93m"
-    LIGHT_RED = "\033[91m"
-    ENDC = "\033[0m"
-    BOLD = "\033[1m"
-    UNDERLINE = "\033[4m"
+        self.report(needs, day).print_text(detail)
+
+
+class FrontierPoint(NamedTuple):
+    usage_weight: float
+    status: str
+    # The soft needs' part of the objective. q is not normalized by the
+    # mids, so it has no offset making it nonnegative, only the differences
+    # between points are meaningful
+    soft: Optional[float]
+    usage: Optional[float]  # Of the minimize_usage foods, over all days
+    amounts: Optional[np.ndarray]  # Of every food, over all days
+    iterations: int
+
+
+class BatchResult(NamedTuple):
+    status: str
+    x: Optional[np.ndarray]
+    error: Optional[str] = None
+
+
+_batch_solver: Optional[RecipeSolver] = None
+
+
+def _init_batch(sparse, day, backend, usage_weight, food_names, matrix, lb, ub, minimize, unit):
+    global _batch_solver
+    _batch_solver = p = RecipeSolver(sparse, day, backend=backend, usage_weight=usage_weight)
+    p.food_names, p.matrix, p.lb, p.ub, p.minimize = food_names, matrix, lb, ub, minimize
+    p.unit = unit
+
+
+def _solve_one(
+    needs: Dict[Nutrient, Tuple[float, Optional[float], NeedRequired, NeedSoftness]],
+) -> BatchResult:
+    p = _batch_solver
+    assert p is not None
+    try:
+        p.needs = needs
+        p._assemble_needs()
+        p._optimize()
+        # The active set backend and _branch_and_bound have no x when the
+        # profile is infeasible
+        if p.sol["x"] is None:
+            return BatchResult(p.sol["status"], None)
+        return BatchResult(p.sol["status"], np.array(p.sol["x"]).ravel() * p.day)
+    except Exception as e:
+        return BatchResult("error", None, repr(e))
@@ -0,0 +1,104 @@
+import bisect
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .catalog import Catalog, CatalogFood, load_catalog
+from .food import CATALOG_PATH, FOODS_DIR, GETTERS, Food
+from .food_getters.getter import Getter
+
+FoodKey = int | str | Food | CatalogFood
+
+
+# Every food there is to solve with, the members of Food and then the foods
+# of the catalogs in foods/ other than the compiled one, e.g. of import-fdc.
+# Ids are dense, Food's in its order and then each catalog's rows, and stay
+# the same while the catalogs do; sources like "usda:748967" are the ids to
+# keep. Catalogs are only opened by the first lookup that gets past Food, so
+# creating a Registry costs the same for 50 foods or 50,000.
+class Registry:
+    def __init__(self, paths: Optional[List[Path]] = None) -> None:
+        self.paths = paths
+        self.members = list(Food)
+        self.member_ids = {food: i for i, food in enumerate(self.members)}
+        self._sources: Optional[Dict[str, Food]] = None
+        self._catalogs: Optional[List[Catalog]] = None
+        self._starts: List[int] = []  # Id of the first food of each catalog
+        self._path_starts: Dict[str, int] = {}
+
+    @property
+    def catalogs(self) -> List[Catalog]:
+        return self._open()
+
+    def _open(self) -> List[Catalog]:
+        if self._catalogs is None:
+            paths = self.paths
+            if paths is None:
+                paths = sorted(p for p in FOODS_DIR.glob("*.bin") if p != CATALOG_PATH)
+            self._catalogs = [c for c in map(load_catalog, paths) if c is not None]
+            start = len(self.members)
+            for catalog in self._catalogs:
+                self._starts.append(start)
+                self._path_starts[str(catalog.path)] = start
+                start += len(catalog)
+        return self._catalogs
+
+    def __len__(self) -> int:
+        return len(self.members) + sum(len(c) for c in self.catalogs)
+
+    def __getitem__(self, key: FoodKey) -> Food | CatalogFood:
+        food = self.get(key)
+        if food is None:
+            raise KeyError(key)
+        return food
+
+    def __contains__(self, key: FoodKey) -> bool:
+        return self.get(key) is not None
+
+    # The food of an id, a Food or catalog name, or a source
+    def get(self, key: FoodKey) -> Optional[Food | CatalogFood]:
+        if isinstance(key, Food):
+            return key
+        if isinstance(key, CatalogFood):
+            self._open()
+            return key if key.path in self._path_starts else None
+        if isinstance(key, int):
+            return self._at(key)
+
+        if key in Food.__members__:
+            return Food[key]
+        if self._sources is None:
+            self._sources = {getter.source: food for food, getter in GETTERS.items() if isinstance(getter, Getter)}
+        if key in self._sources:
+            return self._sources[key]
+        for catalog in self.catalogs:
+            food = catalog.food(key)
+            if food is not None:
+                return food
+        return None
+
+    # Id of the first food of catalog
+    def start(self, catalog: Catalog) -> int:
+        self._open()
+        return self._path_starts[str(catalog.path)]
+
+    def catalog(self, food: CatalogFood) -> Catalog:
+        catalogs = self._open()
+        return catalogs[self._starts.index(self._path_starts[food.path])]
+
+    def id(self, food: Food | CatalogFood) -> int:
+        if isinstance(food, Food):
+            return self.member_ids[food]
+        self._open()
+        return self._path_starts[food.path] + food.row
+
+    def _at(self, id: int) -> Optional[Food | CatalogFood]:
+        if 0 <= id < len(self.members):
+            return self.members[id]
+        catalogs = self._open()
+        k = bisect.bisect_right(self._starts, id) - 1
+        if k < 0 or id - self._starts[k] >= len(catalogs[k]):
+            return None
+        return catalogs[k].at(id - self._starts[k])
+
+
+registry = Registry()
@@ -0,0 +1,159 @@
+from enum import Enum, auto
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from .catalog import CatalogFood
+from .food import Food
+from .nutrient import Nutrient
+from .units import MCG, MG, G
+
+
+# The nutrition of a solution against needs, as arrays over nutrients and
+# foods. Everything is per day and in the base units of units.py, J for
+# energy and g otherwise, except amounts which cover all days.
+class NutritionReport(NamedTuple):
+    day: float
+    foods: List[Food | CatalogFood]
+    nutrients: List[Nutrient]
+    amounts: np.ndarray  # (foods,)
+    contributions: np.ndarray  # (nutrients, foods)
+    totals: np.ndarray  # (nutrients,)
+    lb: np.ndarray
+    ub: np.ndarray
+    required: np.ndarray
+    valid: np.ndarray
+
+    def to_dict(self) -> Dict:
+        return {
+            "status": "optimal",
+            "day": self.day,
+            "foods": {f.name: float(a) for f, a in zip(self.foods, self.amounts)},
+            "nutrients": {
+                n.name: {
+                    "total": float(self.totals[k]),
+                    "lb": float(self.lb[k]),
+                    "ub": float(self.ub[k]) if np.isfinite(self.ub[k]) else None,
+                    "required": bool(self.required[k]),
+                    "valid": bool(self.valid[k]),
+                    "contributions": {
+                        f.name: float(v) for f, v in zip(self.foods, self.contributions[k]) if v != 0
+                    },
+                }
+                for k, n in enumerate(self.nutrients)
+            },
+        }
+
+    def csv_header(self) -> List[str]:
+        return ["day", "nutrient", "total", "lb", "ub", "required", "valid", *(f.name for f in self.foods)]
+
+    def csv_rows(self) -> List[List]:
+        return [
+            [
+                self.day,
+                n.name,
+                self.totals[k],
+                self.lb[k],
+                self.ub[k] if np.isfinite(self.ub[k]) else "",
+                int(self.required[k]),
+                int(self.valid[k]),
+                *self.contributions[k],
+            ]
+            for k, n in enumerate(self.nutrients)
+        ]
+
+    def print_text(self, detail: bool = False):
+        print("Nutrition:")
+        scale, unit = display_units(self.nutrients, self.lb)
+        value, lb, ub = self.totals / scale, self.lb / scale, self.ub / scale
+        # Food contributions are printed over all days
+        comp = self.contributions * self.day / scale[:, None]
+
+        for k, n in enumerate(self.nutrients):
+            if detail:
+                comp_str = " = " + " + ".join(
+                    [f"{f.name} {v:g} {unit[k]}" for f, v in zip(self.foods, comp[k]) if v != 0]
+                )
+            else:
+                comp_str = ""
+
+            if np.count_nonzero(comp[k]) != 1 or not detail:
+                comp_str += f" = {value[k]:g} {unit[k]}"
+
+            if not self.required[k]:
+                color = BColors.GRAY if self.valid[k] else BColors.LIGHT_YELLOW
+            else:
+                color = BColors.LIGHT_GREEN if self.valid[k] else BColors.RED
+
+            print(f"{color}  {n}{comp_str}, valid: {lb[k]:.2f} ~ {ub[k]:.2f} {unit[k]}{BColors.ENDC}")
+
+
+class Bound(Enum):
+    LOWER = auto()
+    UPPER = auto()
+    EQUAL = auto()
+
+
+# One inequality of the QP in the terms it was given in, the bound of a food
+# or a need over all days, or the equality of a food fixed by lb == ub.
+# price is how much the objective grows per unit the bound is raised, read
+# off the multipliers of the solve.
+class Sensitivity(NamedTuple):
+    subject: Food | Nutrient
+    bound: Bound
+    value: float
+    slack: float
+    price: float
+    active: bool
+
+    def to_dict(self) -> Dict:
+        return {
+            "subject": self.subject.name,
+            "kind": "nutrient" if isinstance(self.subject, Nutrient) else "food",
+            "bound": self.bound.name.lower(),
+            "value": self.value,
+            "slack": self.slack,
+            "price": self.price,
+            "active": self.active,
+        }
+
+
+# Active constraints first, by how much they cost
+def print_sensitivity(rows: List[Sensitivity]):
+    print("Sensitivity:")
+    rows = sorted(rows, key=lambda r: (not r.active, -abs(r.price)))
+    nutrients = [r.subject for r in rows if isinstance(r.subject, Nutrient)]
+    scale, unit = display_units(nutrients, np.array([r.value for r in rows if isinstance(r.subject, Nutrient)]))
+    units: Dict[Food | Nutrient, Tuple[float, str]] = dict(zip(nutrients, zip(scale, unit)))
+
+    for r in rows:
+        s, u = units.get(r.subject, (G, "g"))
+        op = {Bound.LOWER: ">=", Bound.UPPER: "<=", Bound.EQUAL: "=="}[r.bound]
+        color = BColors.BOLD if r.active else BColors.GRAY
+        print(
+            f"{color}  {r.subject} {op} {r.value / s:g} {u}, slack {r.slack / s:g} {u}, "
+            f"price {r.price * s:.3g} per {u}{BColors.ENDC}"
+        )
+
+
+def display_units(nutrients: List[Nutrient], lb: np.ndarray):
+    energy = np.array([n == Nutrient.ENERGY for n in nutrients], dtype=bool)
+    scale = np.select([energy, lb >= G, lb >= MG], [1000, G, MG], MCG)
+    unit = np.select([energy, lb >= G, lb >= MG], ["kJ", "g", "mg"], "μg")
+    return scale, unit
+
+
+class BColors:
+    HEADER = "\033[95m"
+    RED = "\033[31m"
+    YELLOW = "\033[33m"
+    GRAY = "\033[37m"
+    OKBLUE = "\033[94m"
+    OKCYAN = "\033[96m"
+    GREEN = "\033[32m"
+    LIGHT_GREEN = "\033[92m"
+    LIGHT_YELLOW = "\033[93m"
+    LIGHT_RED = "\033[91m"
+    ENDC = "\033[0m"
+    BOLD = "\033[1m"
+    UNDERLINE = "\033[4m"
@@ -0,0 +1,137 @@
+import logging
+import os
+from copy import deepcopy
+from heapq import nsmallest
+from itertools import combinations
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .catalog import CatalogFood
+from .food import Food, get_vector
+from .nutrient import NUTRIENT_INDEX
+from .recipe import NeedRequired, NeedSoftness, RecipeSolver
+
+logger = logging.getLogger(__name__)
+
+
+class Combination(NamedTuple):
+    objective: float
+    foods: Tuple[Food, ...]
+    amounts: Dict[Food | CatalogFood, float]
+
+
+# Try every combination of k candidates (food, lb, ub) on top of the foods
+# and needs of base, and return the top feasible ones by objective.
+#
+# Combinations that cannot meet a hard need even with every food at its
+# bound are pruned before solving, and those whose hard constraints conflict
+# otherwise by a feasibility LP before the QP. The rest is solved in lexicographic
+# chunks, one chunk per task: neighbouring combinations share all but one
+# food, so each one patches the previous problem and warm starts from it.
+def search_combinations(
+    base: RecipeSolver,
+    candidates: Sequence[Tuple[Food, float, float]],
+    k: int,
+    top: int = 10,
+    workers: Optional[int] = None,
+) -> List[Combination]:
+    vectors = [get_vector(food) for food, _, _ in candidates]
+    combos = np.array(list(combinations(range(len(candidates)), k)), dtype=np.intp)
+    combos = combos.reshape(-1, k)
+    feasible = _may_be_feasible(base, candidates, vectors, combos)
+    logger.info(f"{len(combos)} combinations, {np.count_nonzero(~feasible)} pruned")
+    combos = combos[feasible]
+
+    workers = workers or os.cpu_count() or 1
+    chunks = np.array_split(combos, max(1, min(len(combos), workers * 8)))
+    state = (base, candidates, vectors)
+
+    if workers == 1:
+        _init_search(*state)
+        results = map(_solve_chunk, chunks)
+        return _top(top, results)
+
+    # Imported here, it takes longer than the CLI needs to solve one recipe
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(workers, initializer=_init_search, initargs=state) as pool:
+        results = pool.map(_solve_chunk, chunks)
+        return _top(top, results)
+
+
+def _top(top: int, results) -> List[Combination]:
+    return nsmallest(top, (c for chunk in results for c in chunk), key=lambda c: c.objective)
+
+
+def _may_be_feasible(
+    base: RecipeSolver,
+    candidates: Sequence[Tuple[Food, float, float]],
+    vectors: List[np.ndarray],
+    combos: np.ndarray,
+) -> np.ndarray:
+    hard = [
+        (NUTRIENT_INDEX[nut], lb, ub)
+        for nut, (lb, ub, required, softness) in base.needs.items()
+        if required == NeedRequired.REQUIRED and softness == NeedSoftness.HARD
+    ]
+    cols = [k for k, _, _ in hard]
+    need_lb = np.array([lb for _, lb, _ in hard])
+    need_ub = np.array([np.inf if ub is None else ub for _, _, ub in hard])
+
+    # Per food nutrient minima and maxima, at the food's lb and ub
+    M = np.array([v[cols] for v in vectors]).reshape(len(vectors), len(cols))
+    lo = M * np.array([lb for _, lb, _ in candidates])[:, None]
+    hi = M * np.array([ub for _, _, ub in candidates])[:, None]
+
+    least = np.zeros(len(cols))
+    most = np.zeros(len(cols))
+    for food, (lb, ub) in base.food_limits.items():
+        least += base.food_vectors[food][cols] * lb
+        most += base.food_vectors[food][cols] * ub
+
+    least = np.broadcast_to(least, (len(combos), len(cols))).copy()
+    most = np.broadcast_to(most, (len(combos), len(cols))).copy()
+    for i in range(combos.shape[1]):
+        least += lo[combos[:, i]]
+        most += hi[combos[:, i]]
+
+    eps = 1e-9
+    ok = (most >= need_lb * (1 - eps)) & (least <= need_ub * (1 + eps))
+    return np.all(ok, axis=1)
+
+
+_search_state: Optional[Tuple[RecipeSolver, Sequence[Tuple[Food, float, float]], List[np.ndarray]]] = None
+
+
+def _init_search(base, candidates, vectors):
+    global _search_state
+    _search_state = (base, candidates, vectors)
+
+
+def _solve_chunk(chunk: np.ndarray) -> List[Combination]:
+    assert _search_state is not None
+    base, candidates, vectors = _search_state
+    p = deepcopy(base)
+    current = set()
+    ret = []
+
+    for combo in chunk:
+        combo = set(combo.tolist())
+        for j in current - combo:
+            p.remove_food(candidates[j][0])
+        for j in sorted(combo - current):
+            food, lb, ub = candidates[j]
+            p.add_food_vector(food, vectors[j], lb, ub)
+        current = combo
+
+        if p.feasible() and p.resolve():
+            ret.append(
+                Combination(
+                    p.sol["primal objective"],
+                    tuple(candidates[j][0] for j in sorted(combo)),
+                    {f: p.amount(i) for i, f in enumerate(p.food_names)},
+                )
+            )
+
+    return ret
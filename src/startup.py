@@ -0,0 +1,60 @@
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+# The CLI is run from shell loops, once per recipe, so its imports are most
+# of its runtime. check() runs a command under -X importtime and holds it
+# to a budget, in ms of import time.
+BUDGET_MS = 120
+# Only needed to fetch a food missing from foods/*.json, see food_getters
+FORBIDDEN = ["requests", "bs4", "urllib3"]
+
+
+class ImportTimes(NamedTuple):
+    total_ms: float
+    modules: Dict[str, float]  # ms spent in each module itself
+
+    def top(self, n: int = 10) -> List[str]:
+        return sorted(self.modules, key=lambda m: -self.modules[m])[:n]
+
+
+# Without the modules every interpreter imports at startup, like site
+def import_times(args: List[str]) -> ImportTimes:
+    interpreter = _self_times(["-c", "pass"])
+    modules = _self_times(["-m", "src", *args])
+    modules = {m: t for m, t in modules.items() if m not in interpreter}
+    return ImportTimes(sum(modules.values()), modules)
+
+
+def _self_times(args: List[str]) -> Dict[str, float]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    modules = {}
+    # import time: self [us] | cumulative | imported package
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        us, _, name = line[len("import time:") :].split("|")
+        if us.strip().isdigit():
+            modules[name.strip()] = int(us) / 1000
+    return modules
+
+
+# Each module at its fastest over runs, the first run may compile
+# __pycache__ and the others are noisy on a busy machine
+def check(args: List[str], budget_ms: float = BUDGET_MS, runs: int = 5) -> bool:
+    samples = [import_times(args).modules for _ in range(runs)]
+    modules = {m: min(s.get(m, t) for s in samples) for m, t in samples[0].items()}
+    times = ImportTimes(sum(modules.values()), modules)
+    forbidden = [m for m in times.modules if m.split(".")[0] in FORBIDDEN]
+
+    print(f"Imports of {' '.join(args)}: {times.total_ms:.1f} ms, budget {budget_ms:g} ms")
+    for m in times.top():
+        print(f"  {times.modules[m]:7.2f} ms  {m}")
+    if forbidden:
+        print(f"Imported without a fetch: {', '.join(sorted(set(m.split('.')[0] for m in forbidden)))}")
+    return times.total_ms <= budget_ms and not forbidden
@@ -0,0 +1,187 @@
+from enum import Enum, auto
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from .catalog import CatalogFood
+from .food import Food, current_catalog, get_vector
+from .nutrient import NUTRIENT_INDEX, NUTRIENTS, Nutrient
+from .registry import Registry, registry
+from .units import G, KCAL
+
+if TYPE_CHECKING:
+    from .recipe import RecipeSolver
+
+# Substitutes are the foods nearest by Euclidean distance over the nutrient
+# vectors, per gram or per energy. Each nutrient is compared as
+# log(1 + amount / scale), scale its median amount over the foods that have
+# it, so that no nutrient weighs more for its unit and twice as much counts
+# the same for every nutrient. Per energy, a few foods with next to no
+# energy are far out on every axis, and would squeeze the others together
+# on a linear one.
+#
+# A KD or ball tree walked in Python visits half its nodes at 52 dimensions
+# and loses to a brute force matrix product. Instead, the points projected
+# on their first COMPONENTS principal axes give a lower bound of every
+# distance at a fraction of the cost, and only foods whose bound beats the
+# k-th best exact distance of CANDIDATES likely ones are compared in full.
+# The result is exact. Fewer components than COMPONENTS leave too loose a
+# bound, more cost more than they save.
+COMPONENTS = 24
+CANDIDATES = 64
+SLACK = 1e-5  # Relative, well over the rounding of a float32 bound
+
+
+class Basis(Enum):
+    GRAM = auto()
+    ENERGY = auto()  # Foods without energy are left out
+
+
+# What the deltas of a substitute are given per
+PER = {Basis.GRAM: 100 * G, Basis.ENERGY: 1000 * KCAL}
+
+
+class Substitute(NamedTuple):
+    id: int
+    food: Food | CatalogFood
+    distance: float
+    deltas: np.ndarray  # Over NUTRIENTS, the substitute's less the food's per PER[basis]
+
+
+class NutrientIndex:
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray, basis: Basis) -> None:
+        self.basis = basis
+        self.ids = ids  # Registry ids, ascending
+        self.vectors = vectors  # Per PER[basis]
+        self.scale = np.ones(len(NUTRIENTS))
+        for j in range(len(NUTRIENTS)):
+            present = vectors[:, j][vectors[:, j] > 0]
+            if len(present):
+                self.scale[j] = np.median(present)
+
+        points = self._point(vectors)
+        self.points = points
+        self.mean = points.mean(axis=0) if len(points) else np.zeros(len(NUTRIENTS))
+        # The axes of a sample are as good for a bound, any orthonormal ones are
+        sample = points[:: max(1, len(points) // 20000)] - self.mean
+        _, _, vt = np.linalg.svd(sample, full_matrices=False)
+        self.axes = vt[:COMPONENTS].T
+        # Single precision halves the time of the product over every food,
+        # the bounds are loosened by more than its rounding instead, which
+        # grows with the norms
+        projected = (points - self.mean) @ self.axes
+        self.projected = projected.astype(np.float32)
+        psq = np.einsum("ij,ij->i", projected, projected)
+        self.psq = (psq * (1 - SLACK) - 1e-9).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # Rows of the k foods nearest to vec, nearest first, and their distances
+    def query(self, vec: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(self))
+        if k <= 0:
+            return np.zeros(0, dtype=int), np.zeros(0)
+        x = self._point(vec)
+        y = (x - self.mean) @ self.axes
+        yy = float(y @ y)
+        # Less y @ y, which is taken from the other side
+        bound = self.projected @ (-2 * y).astype(np.float32)
+        bound += self.psq
+
+        rows = np.argpartition(bound, min(CANDIDATES, len(self) - 1))[: max(CANDIDATES, k)]
+        kth = np.partition(self._distances(rows, x), k - 1)[k - 1]
+        rows = np.flatnonzero(bound <= kth - yy * (1 - SLACK))
+        d = self._distances(rows, x)
+        best = np.argpartition(d, k - 1)[:k]
+        best = best[np.argsort(d[best])]
+        return rows[best], np.sqrt(np.maximum(d[best], 0))
+
+    def _point(self, vectors: np.ndarray) -> np.ndarray:
+        return np.log1p(np.maximum(vectors, 0) / self.scale)
+
+    # Squared
+    def _distances(self, rows: np.ndarray, x: np.ndarray) -> np.ndarray:
+        return ((self.points[rows] - x) ** 2).sum(axis=1)
+
+
+def per_basis(vectors: np.ndarray, basis: Basis) -> np.ndarray:
+    if basis == Basis.GRAM:
+        return vectors * PER[basis]
+    energy = vectors[..., NUTRIENT_INDEX[Nutrient.ENERGY], None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(energy > 0, vectors / energy * PER[basis], np.nan)
+
+
+_indexes: Dict[Tuple[Basis, Registry], NutrientIndex] = {}
+
+
+# Over every food of the registry with nutrients at hand, built once per
+# process and basis
+def nutrient_index(basis: Basis = Basis.GRAM, reg: Registry = registry) -> NutrientIndex:
+    if (basis, reg) not in _indexes:
+        compiled = current_catalog()
+        members = [(i, compiled.index.get(food.name)) for i, food in enumerate(reg.members)]
+        members = [(i, row) for i, row in members if row is not None]
+        ids = [np.array([i for i, _ in members], dtype=np.int64)]
+        vectors = [compiled.matrix[[row for _, row in members]].reshape(len(members), len(NUTRIENTS))]
+        for catalog in reg.catalogs:
+            start = reg.start(catalog)
+            ids.append(np.arange(start, start + len(catalog)))
+            vectors.append(np.asarray(catalog.matrix))
+
+        ids, vectors = np.concatenate(ids), per_basis(np.concatenate(vectors), basis)
+        keep = ~np.isnan(vectors).any(axis=1)
+        _indexes[basis, reg] = NutrientIndex(ids[keep], vectors[keep], basis)
+    return _indexes[basis, reg]
+
+
+def substitutes(
+    food: Food | CatalogFood,
+    k: int = 5,
+    basis: Basis = Basis.GRAM,
+    reg: Registry = registry,
+) -> List[Substitute]:
+    vec = per_basis(get_vector(food), basis)
+    if np.isnan(vec).any():
+        raise ValueError(f"{food} has no energy")
+
+    index = nutrient_index(basis, reg)
+    own = reg.id(food)
+    ret = []
+    # One more, the food itself is most likely the nearest
+    for row, distance in zip(*index.query(vec, k + 1)):
+        id = int(index.ids[row])
+        if id != own:
+            ret.append(Substitute(id, reg[id], float(distance), index.vectors[row] - vec))
+    return ret[:k]
+
+
+# The plan of p with each substitute in place of food, of the same weight
+# or energy as amount g of food, on top of what p has of the substitute
+# already. True where its needs are still met.
+def check_swaps(
+    p: "RecipeSolver",
+    food: Food | CatalogFood,
+    amount: float,
+    subs: List[Substitute],
+    basis: Basis = Basis.GRAM,
+) -> List[bool]:
+    energy = NUTRIENT_INDEX[Nutrient.ENERGY]
+    ret = []
+    for s in subs:
+        vec = get_vector(s.food)
+        swapped = amount if basis == Basis.GRAM else amount * get_vector(food)[energy] / vec[energy]
+        p.remove_food(food)
+        limits = p.food_limits.get(s.food)
+        if limits is None:
+            p.add_food_vector(s.food, vec, swapped, swapped)
+        else:
+            p.update_food_limits(s.food, limits[0] + swapped, limits[1] + swapped)
+        ret.append(bool(p.feasible() and p.resolve()))
+        if limits is None:
+            p.remove_food(s.food)
+        else:
+            p.update_food_limits(s.food, *limits)
+        p.add_food(food, amount, amount)
+    return ret